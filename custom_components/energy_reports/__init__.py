@@ -9,13 +9,19 @@ import voluptuous as vol
 from homeassistant.helpers import config_validation as cv
 
 from homeassistant.components import frontend
-from homeassistant.components.recorder import history as recorder_history, get_instance
 from homeassistant.core import HomeAssistant
 from homeassistant.const import EVENT_HOMEASSISTANT_STOP
 from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.start import async_at_started
 from homeassistant.util import dt as dt_util
 
-from .const import DOMAIN, PANEL_ICON, PANEL_TITLE
+from .const import (
+    DEFAULT_COLLECT_CONFIG,
+    DOMAIN,
+    PANEL_ICON,
+    PANEL_TITLE,
+    STORAGE_COMPACT_INTERVAL,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -26,24 +32,34 @@ from .views import (
     EnergyReportsAutoUpdateConfigView,
     EnergyReportsCleanupConfigView,
     EnergyReportsCleanupRunView,
+    EnergyReportsCollectConfigView,
     EnergyReportsDownloadLatestView,
     EnergyReportsEntitiesSelectView,
     EnergyReportsEntitiesView,
     EnergyReportsGenerateView,
     EnergyReportsHealthView,
     EnergyReportsIndexView,
+    EnergyReportsLiveView,
     EnergyReportsPanelJsView,
+    EnergyReportsReportConfigView,
     EnergyReportsReportsItemView,
     EnergyReportsReportsView,
     EnergyReportsRootView,
     EnergyReportsStatusView,
+    EnergyReportsStorageConfigView,
     EnergyReportsUiView,
-    _convert_history_to_csv,
+    _collect_history,
+    _generate_reports_sync,
+    _load_report_generator,
     _sync_pdfs,
     _cleanup_reports,
-    _history_to_json,
+    _compact_store,
     _read_json,
+    _report_workers,
+    _restart_report_pool,
+    _stop_report_pool,
 )
+from .live import LiveSampleBuffer
 
 
 async def async_setup(hass: HomeAssistant, config: dict) -> bool:
@@ -80,9 +96,39 @@ async def async_setup(hass: HomeAssistant, config: dict) -> bool:
     hass.http.register_view(EnergyReportsAutoUpdateConfigView(hass))
     hass.http.register_view(EnergyReportsCleanupConfigView(hass))
     hass.http.register_view(EnergyReportsCleanupRunView(hass))
+    hass.http.register_view(EnergyReportsCollectConfigView(hass))
+    hass.http.register_view(EnergyReportsStorageConfigView(hass))
+    hass.http.register_view(EnergyReportsReportConfigView(hass))
+    hass.http.register_view(EnergyReportsLiveView(hass))
+
+    live = LiveSampleBuffer(hass, data_path)
+    hass.data[DOMAIN]["live"] = live
+
+    async def _start_live(_: HomeAssistant) -> None:
+        collect_config = await _read_json(
+            hass, data_path / "collect_config.json", DEFAULT_COLLECT_CONFIG
+        )
+        if collect_config.get("live", True):
+            entity_ids = await _read_json(hass, data_path / "selected_entities.json", [])
+            live.async_start(entity_ids)
+
+    # Names and units are resolved from current states, which exist only after startup
+    async_at_started(hass, _start_live)
+
+    async def _start_report_pool(_: HomeAssistant) -> None:
+        # The report stack is imported in the background, off the startup path: here for
+        # loading and analysis, and in the worker processes if more than one is configured
+        try:
+            await hass.async_add_executor_job(_load_report_generator)
+        except Exception as exc:
+            _LOGGER.warning("Report generator failed to load: %s", exc)
+        await _restart_report_pool(hass, await _report_workers(hass))
+
+    async_at_started(hass, _start_report_pool)
 
     last_run = {"value": None}
     last_cleanup = {"value": None}
+    last_compact = {"value": None}
 
     async def _auto_update_worker(_: object) -> None:
         try:
@@ -108,44 +154,18 @@ async def async_setup(hass: HomeAssistant, config: dict) -> bool:
                     selected_path = data_path / "selected_entities.json"
                     entity_ids = await _read_json(hass, selected_path, [])
                     if entity_ids:
-                        start_time = now - timedelta(days=7)
-
-                        def _get_history_sync():
-                            try:
-                                return recorder_history.get_significant_states(
-                                    hass,
-                                    start_time,
-                                    now,
-                                    entity_ids,
-                                    True,
-                                    True,
-                                    True,
-                                    True,
-                                )
-                            except TypeError:
-                                return recorder_history.get_significant_states(
-                                    hass, start_time, now, entity_ids
-                                )
-
-                        recorder = get_instance(hass)
-                        states_map = await recorder.async_add_executor_job(_get_history_sync)
-                        history_data = _history_to_json(entity_ids, states_map)
-                        csv_file = data_path / "all.csv"
+                        result = await _collect_history(
+                            hass, entity_ids, 7, keep_data=True
+                        )
                         await hass.async_add_executor_job(
-                            _convert_history_to_csv, history_data, csv_file
+                            _generate_reports_sync,
+                            data_path,
+                            output_path,
+                            result["data"],
+                            dt_util.utcnow() - timedelta(days=7),
+                            await _report_workers(hass),
+                            hass.data[DOMAIN].get("report_pool"),
                         )
-
-                        def _run_report():
-                            from .report_generator.src.main import ShellyEnergyReport
-
-                            analyzer = ShellyEnergyReport(
-                                data_dir=str(data_path),
-                                output_dir=str(output_path),
-                                correct_timestamps=True,
-                            )
-                            analyzer.run_analysis()
-
-                        await hass.async_add_executor_job(_run_report)
                         await _sync_pdfs(hass, output_path, pdf_path)
                         last_run["value"] = now
 
@@ -156,6 +176,13 @@ async def async_setup(hass: HomeAssistant, config: dict) -> bool:
                 ):
                     await _cleanup_reports(hass, int(retention_days))
                     last_cleanup["value"] = now
+
+            now = dt_util.now()
+            if last_compact["value"] is None or (now - last_compact["value"]) >= STORAGE_COMPACT_INTERVAL:
+                dropped = await _compact_store(hass)
+                if any(dropped.values()):
+                    _LOGGER.info("Storage compaction dropped days per tier: %s", dropped)
+                last_compact["value"] = now
         except Exception as exc:
             _LOGGER.warning("Auto-update worker error: %s", exc)
 
@@ -164,6 +191,12 @@ async def async_setup(hass: HomeAssistant, config: dict) -> bool:
 
     async def _stop(_: object) -> None:
         unsub()
+        _stop_report_pool(hass)
+        live.async_stop_tracking()
+        try:
+            await live.async_flush()
+        except Exception as exc:
+            _LOGGER.warning("Live buffer flush on stop failed: %s", exc)
 
     hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _stop)
 
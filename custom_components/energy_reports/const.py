@@ -1,3 +1,37 @@
+from datetime import timedelta
+
 DOMAIN = "energy_reports"
 PANEL_TITLE = "Energy Reports"
 PANEL_ICON = "mdi:chart-line"
+
+DEFAULT_COLLECT_CONFIG = {
+    "incremental": True,
+    "overlap_minutes": 10,
+    "export_csv": False,
+    "statistics": "auto",
+    "statistics_after_days": 14,
+    "live": True,
+}
+STATISTICS_MODES = ("auto", "always", "never")
+# Recorder default for short-term (5-minute) statistics retention
+SHORT_TERM_STATISTICS_DAYS = 10
+
+# Processes used to build device reports: 1 builds them in the Home Assistant process,
+# more (or 0 = one per core, up to 4) keep a warm pool of worker processes running
+DEFAULT_REPORT_WORKERS = 1
+DEFAULT_REPORT_CONFIG = {"workers": DEFAULT_REPORT_WORKERS}
+
+# Days each storage tier is kept (0 = forever); expired days are first downsampled
+# into the next coarser tier (samples -> minute -> quarter -> hourly -> daily)
+DEFAULT_STORAGE_CONFIG = {
+    "samples_days": 0,
+    "minute_days": 0,
+    "quarter_days": 0,
+    "hourly_days": 0,
+    "daily_days": 0,
+}
+STORAGE_COMPACT_INTERVAL = timedelta(hours=6)
+
+# Per-entity ring buffer of live state_changed samples and how often it is flushed
+LIVE_BUFFER_SIZE = 4096
+LIVE_FLUSH_INTERVAL = timedelta(minutes=5)
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+from array import array
+from datetime import timedelta
+import logging
+from pathlib import Path
+from typing import Callable
+
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers.event import (
+    async_track_state_change_event,
+    async_track_time_interval,
+)
+from homeassistant.util import dt as dt_util
+
+from .const import DEFAULT_COLLECT_CONFIG, LIVE_BUFFER_SIZE, LIVE_FLUSH_INTERVAL
+from .views import (
+    _advance_watermark,
+    _collect_lock,
+    _dump_watermarks,
+    _entity_metadata,
+    _load_watermarks,
+    _open_store,
+    _read_json,
+    _read_json_sync,
+    _write_json,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SampleRing:
+    """Fixed-size ring of (timestamp, value) samples for one entity.
+
+    ``pending`` counts samples not yet flushed to the store; if it would exceed the
+    capacity the oldest unflushed samples are lost and ``overflowed`` is set, so the
+    recorder has to backfill that entity up to ``lost_until``. ``backfilled`` is set once a
+    recorder collection has covered the gap before the buffer started.
+    """
+
+    __slots__ = (
+        "timestamps", "values", "head", "size", "pending", "overflowed", "lost_until", "backfilled"
+    )
+
+    def __init__(self, capacity: int) -> None:
+        self.timestamps = array("q", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.head = 0
+        self.size = 0
+        self.pending = 0
+        self.overflowed = False
+        self.lost_until = 0
+        self.backfilled = False
+
+    def append(self, timestamp: int, value: float) -> None:
+        capacity = len(self.timestamps)
+        if self.pending == capacity:
+            # The oldest unflushed sample is overwritten
+            self.overflowed = True
+            self.lost_until = max(self.lost_until, self.timestamps[self.head])
+        self.timestamps[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % capacity
+        self.size = min(self.size + 1, capacity)
+        self.pending = min(self.pending + 1, capacity)
+
+    def latest(self, count: int) -> tuple[array, array]:
+        """Return the newest ``count`` samples in time order."""
+        count = min(count, self.size)
+        start = (self.head - count) % len(self.timestamps)
+        end = start + count
+        if end <= len(self.timestamps):
+            return self.timestamps[start:end], self.values[start:end]
+        end -= len(self.timestamps)
+        return (
+            self.timestamps[start:] + self.timestamps[:end],
+            self.values[start:] + self.values[:end],
+        )
+
+
+class LiveSampleBuffer:
+    """Capture ``state_changed`` events of the selected entities into per-entity rings.
+
+    The rings are flushed into the Parquet store every ``LIVE_FLUSH_INTERVAL``. Once the
+    recorder has backfilled an entity's startup gap (and any overflow), flushes also advance
+    its collection watermark, so incremental collection only queries the recorder for
+    entities the buffer does not cover.
+    """
+
+    def __init__(self, hass: HomeAssistant, data_path: Path, capacity: int = LIVE_BUFFER_SIZE) -> None:
+        self.hass = hass
+        self.data_path = data_path
+        self.capacity = capacity
+        self.rings: dict[str, SampleRing] = {}
+        self.metadata: dict[str, tuple[str, float]] = {}
+        self.started_at: float | None = None
+        self._unsubs: list[Callable[[], None]] = []
+
+    @callback
+    def async_start(self, entity_ids: list[str]) -> None:
+        self.async_stop_tracking()
+        self.rings = {entity_id: SampleRing(self.capacity) for entity_id in entity_ids}
+        self.metadata = _entity_metadata(self.hass, entity_ids)
+        self.started_at = dt_util.utcnow().timestamp()
+        if entity_ids:
+            self._unsubs.append(
+                async_track_state_change_event(self.hass, entity_ids, self._async_state_changed)
+            )
+            self._unsubs.append(
+                async_track_time_interval(self.hass, self._async_flush_interval, LIVE_FLUSH_INTERVAL)
+            )
+
+    @callback
+    def async_stop_tracking(self) -> None:
+        while self._unsubs:
+            self._unsubs.pop()()
+        self.started_at = None
+
+    @callback
+    def _async_state_changed(self, event: Event) -> None:
+        new_state = event.data.get("new_state")
+        if new_state is None:
+            return
+        ring = self.rings.get(new_state.entity_id)
+        if ring is None:
+            return
+        try:
+            value = float(new_state.state)
+        except (TypeError, ValueError):
+            return
+        scale = self.metadata.get(new_state.entity_id, (None, 1.0))[1]
+        ring.append(int(new_state.last_changed.timestamp()), value * scale)
+
+    def covers(self, entity_id: str, since: float) -> bool:
+        """Whether every state change of ``entity_id`` after ``since`` was captured."""
+        ring = self.rings.get(entity_id)
+        return (
+            ring is not None
+            and ring.backfilled
+            and not ring.overflowed
+            and self.started_at is not None
+            and self.started_at <= since
+        )
+
+    @callback
+    def async_backfilled(self, entity_ids: list[str], until: float) -> None:
+        """Record that the recorder has written the states of ``entity_ids`` up to ``until``.
+
+        This covers the gap before the buffer started and clears overflows whose lost
+        samples are older than ``until``.
+        """
+        for entity_id in entity_ids:
+            ring = self.rings.get(entity_id)
+            if ring is None:
+                continue
+            if self.started_at is not None and self.started_at <= until:
+                ring.backfilled = True
+            if ring.overflowed and ring.lost_until <= until:
+                ring.overflowed = False
+
+    def samples(self, entity_id: str, limit: int) -> list[list[float]]:
+        ring = self.rings.get(entity_id)
+        if ring is None:
+            return []
+        timestamps, values = ring.latest(limit)
+        return [[ts, value] for ts, value in zip(timestamps, values)]
+
+    async def _async_flush_interval(self, _: object) -> None:
+        try:
+            await self.async_flush()
+        except Exception as exc:
+            _LOGGER.warning("Live buffer flush failed: %s", exc)
+
+    async def async_flush(self) -> int:
+        """Write pending samples to the store and advance the watermarks of covered entities.
+
+        The watermark of an entity whose startup gap or overflow has not been backfilled is
+        left alone (or not created), so the next collection still queries the recorder from it.
+        """
+        pending = []
+        for entity_id, ring in self.rings.items():
+            if not ring.pending:
+                continue
+            timestamps, values = ring.latest(ring.pending)
+            name = self.metadata.get(entity_id, (entity_id, 1.0))[0]
+            advance = ring.backfilled and not ring.overflowed
+            pending.append((entity_id, name, timestamps, values, advance))
+            ring.pending = 0
+        if not pending:
+            return 0
+
+        try:
+            async with _collect_lock(self.hass):
+                config = await _read_json(
+                    self.hass, self.data_path / "collect_config.json", DEFAULT_COLLECT_CONFIG
+                )
+                overlap = timedelta(
+                    minutes=config.get("overlap_minutes", DEFAULT_COLLECT_CONFIG["overlap_minutes"])
+                )
+                return await self.hass.async_add_executor_job(
+                    _flush_blocks_sync, self.data_path, pending, overlap
+                )
+        except Exception:
+            # The samples are gone from the pending window; let the recorder backfill them.
+            for entity_id, _, timestamps, _, _ in pending:
+                ring = self.rings.get(entity_id)
+                if ring is not None:
+                    ring.overflowed = True
+                    ring.lost_until = max(ring.lost_until, timestamps[-1])
+            raise
+
+
+def _flush_blocks_sync(
+    data_path: Path,
+    pending: list[tuple[str, str, array, array, bool]],
+    overlap: timedelta,
+) -> int:
+    """Write (entity_id, name, timestamps, values, advance) samples to the store.
+
+    Only entities flagged ``advance`` get their watermark moved past the samples.
+    """
+    import numpy as np
+
+    from .report_generator.src.store import EntityBlock
+
+    store = _open_store(data_path)
+    state_path = data_path / "collect_state.json"
+    state = _read_json_sync(state_path, {})
+    watermarks = _load_watermarks(state, overlap)
+
+    written = 0
+    for entity_id, name, timestamps, values, advance in pending:
+        block = EntityBlock(
+            entity_id,
+            name,
+            np.frombuffer(timestamps, dtype=np.int64),
+            np.frombuffer(values, dtype=np.float64),
+        )
+        # Appended as small files; compaction merges them into the day partitions
+        written += store.append(block.entity_id, block.to_table())
+        if advance:
+            _advance_watermark(watermarks, block)
+
+    state["entities"] = _dump_watermarks(watermarks, overlap)
+    _write_json(state_path, state)
+    return written
+
@@ -0,0 +1,224 @@
+"""
+Chart rendering on Figure/Agg canvases, without pyplot.
+
+pyplot keeps global figure and style state, so it is not safe to use from several executor
+threads. Each thread gets its own ChartRenderer (see renderer()), which keeps one styled
+figure per chart layout and reuses it: a render only updates the data of the existing
+artists (lines, histogram bars, the mean marker), replaces the bars or heatmap cells when
+their number changes, sets the labels, and draws the Agg canvas.
+
+Renders return the canvas pixels as a RenderedChart, which the PDF embeds directly; a PNG
+is only encoded when the chart is saved to a file.
+
+The look follows matplotlib's seaborn-v0_8-darkgrid style, applied to each axes instead
+of the global rcParams.
+"""
+
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Optional, Sequence
+
+import matplotlib.dates as mdates
+import matplotlib.ticker as mticker
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+CHART_DPI = 150
+AXES_BACKGROUND = "#EAEAF2"
+TEXT_COLOR = ".15"
+BAR_COLOR = "steelblue"
+LINE_COLOR = "b"
+MEAN_COLOR = "red"
+HEATMAP_CMAP = "YlOrRd"
+# Heatmap tick labels are thinned out beyond this many columns
+HEATMAP_MAX_LABELS = 31
+
+
+def _style_axes(ax, grid: bool = True):
+    """Dark grid look: grey background, white grid lines, no spines or tick marks."""
+    ax.set_facecolor(AXES_BACKGROUND)
+    ax.set_axisbelow(True)
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    ax.tick_params(
+        which="both", length=0, colors=TEXT_COLOR, labelcolor=TEXT_COLOR,
+        grid_color="white", grid_linestyle="-",
+    )
+    ax.xaxis.label.set_color(TEXT_COLOR)
+    ax.yaxis.label.set_color(TEXT_COLOR)
+    ax.title.set_color(TEXT_COLOR)
+    ax.grid(grid, alpha=0.3)
+
+
+class RenderedChart:
+    """RGB pixels of a rendered chart and the name its PNG is saved under."""
+
+    __slots__ = ("name", "pixels")
+
+    def __init__(self, name: str, pixels: np.ndarray):
+        self.name = name
+        self.pixels = pixels
+
+    def image(self) -> Image.Image:
+        return Image.fromarray(self.pixels)
+
+    def save(self, directory: Path, compress_level: int = 6) -> Path:
+        path = directory / f"{self.name}.png"
+        self.image().save(path, format="PNG", dpi=(CHART_DPI, CHART_DPI), compress_level=compress_level)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "RenderedChart":
+        """Read a chart saved by save(); its name is the file stem."""
+        with Image.open(path) as image:
+            return cls(Path(path).stem, np.asarray(image.convert("RGB")))
+
+
+class ChartTemplate:
+    """A figure with one styled axes and the artists that are reused between renders."""
+
+    def __init__(self, figsize: tuple, grid: bool = True):
+        self.figure = Figure(figsize=figsize, dpi=CHART_DPI, facecolor="white")
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        _style_axes(self.ax, grid)
+        self.artists = {}
+
+    def label(self, title: str, xlabel: str, ylabel: str, title_size: int = 14, bold: bool = False):
+        self.ax.set_title(title, fontsize=title_size, fontweight="bold" if bold else "normal", color=TEXT_COLOR)
+        self.ax.set_xlabel(xlabel, fontsize=12)
+        self.ax.set_ylabel(ylabel, fontsize=12)
+
+    def rescale(self):
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+    def render(self, name: str) -> RenderedChart:
+        self.figure.tight_layout()
+        canvas = self.figure.canvas
+        canvas.draw()
+        # The canvas buffer is reused by the next render, so the pixels are copied out
+        pixels = np.ascontiguousarray(np.asarray(canvas.buffer_rgba())[..., :3])
+        return RenderedChart(name, pixels)
+
+
+class ChartRenderer:
+    """Per-thread set of chart templates, keyed by chart kind and figure size."""
+
+    def __init__(self):
+        self._templates = {}
+
+    def _template(self, key: tuple, figsize: tuple, grid: bool = True) -> ChartTemplate:
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = ChartTemplate(figsize, grid)
+        return template
+
+    def line(self, name: str, x, y, title: str, xlabel: str, ylabel: str, figsize: tuple = (12, 6),
+             date_format: str = "%H:%M", rotation: int = 0, title_size: int = 14, bold: bool = True) -> RenderedChart:
+        """Line over a datetime x axis."""
+        template = self._template(("line", figsize), figsize)
+        line = template.artists.get("line")
+        if line is None:
+            line, = template.ax.plot([], [], "-", color=LINE_COLOR, linewidth=1.5, alpha=0.8)
+            template.artists["line"] = line
+            locator = mdates.AutoDateLocator()
+            template.ax.xaxis.set_major_locator(locator)
+        line.set_data(mdates.date2num(np.asarray(x, dtype="datetime64[ns]")), np.asarray(y, dtype=float))
+        template.ax.xaxis.set_major_formatter(mdates.DateFormatter(date_format))
+        template.ax.tick_params(axis="x", labelrotation=rotation)
+        template.label(title, xlabel, ylabel, title_size, bold)
+        template.rescale()
+        return template.render(name)
+
+    def bars(self, name: str, x: Sequence[float], heights: Sequence[float], title: str, xlabel: str,
+             ylabel: str, figsize: tuple = (12, 6), ticks: Optional[Sequence[float]] = None,
+             tick_labels: Optional[Sequence[str]] = None, rotation: int = 0, title_size: int = 14,
+             bold: bool = True) -> RenderedChart:
+        """Bar chart; the bars are rebuilt because their number changes between renders."""
+        template = self._template(("bars", figsize), figsize)
+        ax = template.ax
+        previous = template.artists.pop("bars", None)
+        if previous is not None:
+            previous.remove()
+            ax.relim()
+        template.artists["bars"] = ax.bar(np.asarray(x), np.asarray(heights, dtype=float), alpha=0.7, color=BAR_COLOR)
+        if ticks is None:
+            ax.xaxis.set_major_locator(mticker.AutoLocator())
+        else:
+            ax.set_xticks(ticks)
+        if tick_labels is None:
+            ax.xaxis.set_major_formatter(mticker.ScalarFormatter())
+        else:
+            ax.set_xticks(x if ticks is None else ticks, tick_labels)
+        ax.tick_params(axis="x", labelrotation=rotation)
+        template.label(title, xlabel, ylabel, title_size, bold)
+        template.rescale()
+        return template.render(name)
+
+    def histogram(self, name: str, values, bins: int, title: str, xlabel: str, ylabel: str,
+                  figsize: tuple = (10, 6), title_size: int = 14) -> RenderedChart:
+        """Histogram with a dashed mean marker; the bin rectangles are resized in place."""
+        template = self._template(("histogram", figsize, bins), figsize)
+        ax = template.ax
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        counts, edges = np.histogram(values, bins=bins)
+        rects = template.artists.get("rects")
+        if rects is None:
+            _, _, rects = ax.hist(values, bins=bins, edgecolor="black", alpha=0.7, color=BAR_COLOR)
+            template.artists["rects"] = rects
+            template.artists["mean"] = ax.axvline(0, color=MEAN_COLOR, linestyle="--")
+        else:
+            for rect, left, right, count in zip(rects, edges[:-1], edges[1:], counts):
+                rect.set_x(left)
+                rect.set_width(right - left)
+                rect.set_height(count)
+        mean = float(values.mean()) if len(values) else 0.0
+        marker = template.artists["mean"]
+        marker.set_xdata([mean, mean])
+        marker.set_label(f"Media: {mean:.1f} W")
+        ax.legend(handles=[marker], frameon=False)
+        template.label(title, xlabel, ylabel, title_size)
+        template.rescale()
+        return template.render(name)
+
+    def heatmap(self, name: str, values: np.ndarray, row_labels: Sequence, column_labels: Sequence,
+                title: str, xlabel: str, ylabel: str, colorbar_label: str, figsize: tuple = (12, 8)) -> RenderedChart:
+        """Cell heatmap with the first row on top, like seaborn.heatmap."""
+        template = self._template(("heatmap", figsize), figsize, grid=False)
+        ax = template.ax
+        previous = template.artists.pop("mesh", None)
+        if previous is not None:
+            previous.remove()
+        values = np.asarray(values, dtype=float)
+        mesh = ax.pcolormesh(values, cmap=HEATMAP_CMAP)
+        template.artists["mesh"] = mesh
+        colorbar = template.artists.get("colorbar")
+        if colorbar is None:
+            template.artists["colorbar"] = template.figure.colorbar(mesh, ax=ax, label=colorbar_label)
+        else:
+            colorbar.update_normal(mesh)
+        rows, columns = values.shape
+        step = max(1, -(-columns // HEATMAP_MAX_LABELS))
+        ax.set_xticks(np.arange(0, columns, step) + 0.5, [str(label) for label in column_labels][::step], rotation=90)
+        ax.set_yticks(np.arange(rows) + 0.5, [str(label) for label in row_labels], rotation=0)
+        ax.set_xlim(0, columns)
+        ax.set_ylim(rows, 0)
+        template.label(title, xlabel, ylabel, 16, True)
+        return template.render(name)
+
+
+_local = threading.local()
+
+
+def renderer() -> ChartRenderer:
+    """The chart renderer of the calling thread."""
+    chart_renderer = getattr(_local, "renderer", None)
+    if chart_renderer is None:
+        chart_renderer = _local.renderer = ChartRenderer()
+    return chart_renderer
@@ -1,27 +1,109 @@
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime, timedelta
 import csv
+from functools import partial
+import heapq
 import json
+import logging
 import re
+from operator import itemgetter
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any, Iterator
 import shutil
 
 from aiohttp import web
 from homeassistant.components.recorder import history as recorder_history, get_instance
+from homeassistant.components.recorder.statistics import statistics_during_period
 from homeassistant.components.http import HomeAssistantView
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers import entity_registry as er
 from homeassistant.util import dt as dt_util
 
-from .const import DOMAIN
-from .report_generator.src.main import ShellyEnergyReport
+from .const import (
+    DEFAULT_COLLECT_CONFIG,
+    DEFAULT_REPORT_CONFIG,
+    DEFAULT_REPORT_WORKERS,
+    DEFAULT_STORAGE_CONFIG,
+    DOMAIN,
+    SHORT_TERM_STATISTICS_DAYS,
+    STATISTICS_MODES,
+)
+from .report_generator.src.worker import ReportWorkerPool, resolve_workers
+
+if TYPE_CHECKING:
+    from .report_generator.src.store import EnergyDataStore, EntityBlock
+
+_LOGGER = logging.getLogger(__name__)
+
+STATISTICS_PERIODS = {"5minute": 300, "hour": 3600}
+# Samples are stored in W/Wh
+UNIT_SCALE = {"kW": 1000.0, "kWh": 1000.0, "MW": 1_000_000.0, "MWh": 1_000_000.0}
 
 
 def _get_paths(hass: HomeAssistant) -> dict[str, Path]:
     return hass.data[DOMAIN]
 
 
+# The report generator (pandas, matplotlib, reportlab) and its store (pyarrow) take seconds
+# to import, so they are only imported from executor jobs, never at setup or on the loop.
+def _open_store(data_path: Path) -> EnergyDataStore:
+    from .report_generator.src.store import EnergyDataStore
+
+    return EnergyDataStore(data_path)
+
+
+def _has_collected_data_sync(data_path: Path) -> bool:
+    store = _open_store(data_path)
+    return (
+        store.has_data()
+        or store.has_data("statistics")
+        or (data_path / "all.csv").exists()
+    )
+
+
+def _load_report_generator() -> type:
+    """Import the report generator and return ShellyEnergyReport."""
+    from .report_generator.src.main import ShellyEnergyReport
+
+    return ShellyEnergyReport
+
+
+async def _report_workers(hass: HomeAssistant) -> int:
+    config = await _read_json(
+        hass, _get_paths(hass)["data_path"] / "report_config.json", DEFAULT_REPORT_CONFIG
+    )
+    return max(int(config.get("workers", DEFAULT_REPORT_WORKERS) or 0), 0)
+
+
+def _stop_report_pool(hass: HomeAssistant) -> None:
+    pool = _get_paths(hass).pop("report_pool", None)
+    if pool is not None:
+        pool.shutdown()
+
+
+async def _restart_report_pool(hass: HomeAssistant, workers: int) -> None:
+    """Replace the warm worker pool with one of ``workers`` processes.
+
+    A single worker builds the reports in the Home Assistant process, so no pool is kept.
+    """
+    _stop_report_pool(hass)
+    if resolve_workers(workers) == 1:
+        return
+    pool = ReportWorkerPool(workers)
+    _get_paths(hass)["report_pool"] = pool
+    try:
+        await hass.async_add_executor_job(pool.start)
+    except Exception as exc:
+        _LOGGER.warning("Report worker pool failed to start: %s", exc)
+
+
+def _collect_lock(hass: HomeAssistant) -> asyncio.Lock:
+    """Serialize writers of the store and collect_state.json (collection and live flushes)."""
+    return hass.data[DOMAIN].setdefault("collect_lock", asyncio.Lock())
+
+
 
 def _read_json_sync(path: Path, default: Any) -> Any:
     if not path.exists():
@@ -47,6 +129,9 @@ def _sync_pdfs_sync(output_path: Path, pdf_path: Path) -> int:
     pdf_path.mkdir(parents=True, exist_ok=True)
     copied = 0
     for pdf in output_path.rglob("*.pdf"):
+        # Skip the report cache (output/.cache)
+        if any(part.startswith(".") for part in pdf.relative_to(output_path).parts):
+            continue
         try:
             target = pdf_path / pdf.name
             shutil.copy2(pdf, target)
@@ -113,42 +198,67 @@ async def _cleanup_reports(hass: HomeAssistant, retention_days: int) -> dict[str
     )
 
 
-def _convert_history_to_csv(history_data: list[list[dict[str, Any]]], output_file: Path) -> bool:
-    try:
-        all_rows: list[dict[str, Any]] = []
-        for entity_history in history_data:
-            if not entity_history:
-                continue
-            for state in entity_history:
-                try:
-                    timestamp = datetime.fromisoformat(state["last_changed"].replace("Z", "+00:00"))
-                    try:
-                        value = float(state["state"])
-                    except (ValueError, TypeError):
-                        continue
-
-                    entity_id = state["entity_id"]
-                    friendly_name = state.get("attributes", {}).get("friendly_name", entity_id)
-
-                    all_rows.append(
-                        {
-                            "timestamp": int(timestamp.timestamp()),
-                            "entity_id": entity_id,
-                            "friendly_name": friendly_name,
-                            "value": value,
-                        }
-                    )
-                except Exception:
-                    continue
+def _merge_store_sync(data_path: Path) -> int:
+    return _open_store(data_path).merge_appends()
+
+
+def _compact_store_sync(data_path: Path, config: dict[str, Any]) -> dict[str, int]:
+    from .report_generator.src.store import tier_retention
 
-        if not all_rows:
-            return False
+    store = _open_store(data_path)
+    store.merge_appends()
+    retention = tier_retention(config)
+    if not any(retention.values()):
+        return {}
+    return store.compact(retention)
 
-        all_rows.sort(key=lambda x: x["timestamp"])
 
-        output_file.parent.mkdir(parents=True, exist_ok=True)
-        with output_file.open("w", newline="", encoding="utf-8") as handle:
-            fieldnames = [
+async def _compact_store(hass: HomeAssistant) -> dict[str, int]:
+    """Merge the live buffer's appended files and apply the storage tier retention.
+
+    Serialized with collection and live flushes.
+    """
+    paths = _get_paths(hass)
+    config = await _read_json(
+        hass, paths["data_path"] / "storage_config.json", DEFAULT_STORAGE_CONFIG
+    )
+    async with _collect_lock(hass):
+        return await hass.async_add_executor_job(
+            _compact_store_sync, paths["data_path"], config
+        )
+
+
+def _entity_metadata(
+    hass: HomeAssistant, entity_ids: list[str]
+) -> dict[str, tuple[str, float]]:
+    """Resolve friendly_name and the W/Wh scale factor once per entity.
+
+    History is fetched without attributes, so the name and unit come from the current
+    state, falling back to the entity registry for entities that are currently unavailable.
+    """
+    registry = er.async_get(hass)
+    metadata: dict[str, tuple[str, float]] = {}
+    for entity_id in entity_ids:
+        name = unit = None
+        current = hass.states.get(entity_id)
+        if current is not None:
+            name = current.attributes.get("friendly_name")
+            unit = current.attributes.get("unit_of_measurement")
+        entry = registry.async_get(entity_id)
+        if entry is not None:
+            name = name or entry.name or entry.original_name
+            unit = unit or entry.unit_of_measurement
+        metadata[entity_id] = (name or entity_id, UNIT_SCALE.get(unit, 1.0))
+    return metadata
+
+
+def _write_samples_csv(rows: Iterator[tuple[float, str, str, float]], output_file: Path) -> int:
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with output_file.open("w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(
+            [
                 "timestamp",
                 "entity_id",
                 "friendly_name",
@@ -157,27 +267,76 @@ def _convert_history_to_csv(history_data: list[list[dict[str, Any]]], output_fil
                 "avg_voltage",
                 "avg_current",
             ]
-            writer = csv.DictWriter(handle, fieldnames=fieldnames)
-            writer.writeheader()
-            for row in all_rows:
-                power = row["value"]
-                voltage = 230.0
-                current = power / voltage if voltage > 0 else 0
-                writer.writerow(
-                    {
-                        "timestamp": row["timestamp"],
-                        "entity_id": row["entity_id"],
-                        "friendly_name": row["friendly_name"],
-                        "total_act_energy": power,
-                        "max_act_power": power,
-                        "avg_voltage": voltage,
-                        "avg_current": current,
-                    }
-                )
+        )
+        for timestamp, entity_id, friendly_name, power in rows:
+            voltage = 230.0
+            current = power / voltage if voltage > 0 else 0
+            writer.writerow(
+                [int(timestamp), entity_id, friendly_name, power, power, voltage, current]
+            )
+            written += 1
+    return written
 
-        return True
-    except Exception:
-        return False
+
+def _export_store_to_csv(data_path: Path, output_file: Path) -> int:
+    """Export the Parquet store as all.csv, merging the sorted per-entity rows with a heap."""
+    store = _open_store(data_path)
+    rows = heapq.merge(
+        *(store.iter_rows(entity_id) for entity_id in store.entity_ids()),
+        key=itemgetter(0),
+    )
+    return _write_samples_csv(rows, output_file)
+
+
+def _store_history_sync(
+    states_map: dict[str, list[Any]],
+    metadata: dict[str, tuple[str, float]],
+    data_path: Path,
+    watermarks: dict[str, dict[str, Any]],
+    full: bool,
+) -> list[EntityBlock]:
+    """Write history into the Parquet store, skipping rows already persisted.
+
+    Each watermark holds ``since`` (start of the overlap window) and ``recent`` (timestamps
+    already written inside it), and is advanced in place with the rows written here.
+    Returns the blocks that were written.
+    """
+    import numpy as np
+
+    from .report_generator.src.store import EntityBlock
+
+    store = _open_store(data_path)
+    if full:
+        store.clear()
+
+    written: list[EntityBlock] = []
+    for entity_id, states in states_map.items():
+        friendly_name, scale = metadata.get(entity_id, (entity_id, 1.0))
+        block = EntityBlock.from_states(entity_id, friendly_name, states, scale)
+        mark = watermarks.get(entity_id)
+        if mark:
+            block = block.filter(
+                (block.timestamps >= mark["since"])
+                & ~np.isin(block.timestamps, list(mark["recent"]))
+            )
+        if not len(block):
+            continue
+
+        store.write(entity_id, block.to_table())
+        written.append(block)
+        _advance_watermark(watermarks, block)
+
+    return written
+
+
+def _advance_watermark(
+    watermarks: dict[str, dict[str, Any]], block: EntityBlock
+) -> None:
+    mark = watermarks.setdefault(
+        block.entity_id, {"last_changed": 0.0, "since": 0.0, "recent": set()}
+    )
+    mark["last_changed"] = max(mark["last_changed"], float(block.timestamps.max()))
+    mark["recent"].update(block.timestamps.tolist())
 
 
 def _discover_shelly_entities(hass: HomeAssistant) -> list[dict[str, str]]:
@@ -196,32 +355,387 @@ def _discover_shelly_entities(hass: HomeAssistant) -> list[dict[str, str]]:
     return entities
 
 
-def _history_to_json(entity_ids: list[str], states_map: dict[str, list[Any]]) -> list[list[dict[str, Any]]]:
-    history_data: list[list[dict[str, Any]]] = []
-    for entity_id in entity_ids:
-        history_states = states_map.get(entity_id, [])
-        entity_list = []
-        for state in history_states:
-            if isinstance(state, dict):
-                entity_list.append(
-                    {
-                        "entity_id": state.get("entity_id", entity_id),
-                        "state": state.get("state"),
-                        "attributes": dict(state.get("attributes", {})),
-                        "last_changed": state.get("last_changed"),
-                    }
-                )
-            else:
-                entity_list.append(
-                    {
-                        "entity_id": state.entity_id,
-                        "state": state.state,
-                        "attributes": dict(state.attributes),
-                        "last_changed": state.last_changed.isoformat(),
-                    }
+def _fetch_history_sync(
+    hass: HomeAssistant,
+    entity_ids: list[str],
+    start_time: datetime,
+    end_time: datetime,
+    include_start_time_state: bool = True,
+) -> dict[str, list[Any]]:
+    try:
+        return recorder_history.get_significant_states(
+            hass,
+            start_time,
+            end_time,
+            entity_ids=entity_ids,
+            include_start_time_state=include_start_time_state,
+            significant_changes_only=True,
+            minimal_response=True,
+            no_attributes=True,
+            compressed_state_format=True,
+        )
+    except TypeError:
+        return recorder_history.get_significant_states(
+            hass, start_time, end_time, entity_ids
+        )
+
+
+def _fetch_statistics_sync(
+    hass: HomeAssistant,
+    entity_ids: list[str],
+    start_time: datetime,
+    end_time: datetime,
+    period: str,
+) -> dict[str, list[dict[str, Any]]]:
+    return statistics_during_period(
+        hass,
+        start_time,
+        end_time,
+        set(entity_ids),
+        period,
+        {"power": "W", "energy": "Wh"},
+        {"mean", "min", "max", "change"},
+    )
+
+
+def _store_statistics_sync(
+    statistics: dict[str, list[dict[str, Any]]],
+    friendly_names: dict[str, str],
+    data_path: Path,
+    period: str,
+) -> int:
+    """Replace the statistics table with pre-aggregated rows, one per entity and period.
+
+    Power sensors report mean/min/max, energy meters report the per-period change of their
+    sum; each row gets both an average power and the energy used during the period.
+    """
+    from .report_generator.src.store import statistics_table
+
+    store = _open_store(data_path)
+    store.clear("statistics")
+    seconds = STATISTICS_PERIODS[period]
+    hours = seconds / 3600
+
+    written = 0
+    for entity_id, rows in statistics.items():
+        timestamps, means, mins, maxs, energies = [], [], [], [], []
+        for row in rows:
+            mean = row.get("mean")
+            change = row.get("change")
+            if mean is None and change is None:
+                continue
+            if mean is None:
+                mean = change / hours
+            start = row["start"]
+            if isinstance(start, datetime):
+                start = start.timestamp()
+            timestamps.append(int(start))
+            means.append(mean)
+            mins.append(row["min"] if row.get("min") is not None else mean)
+            maxs.append(row["max"] if row.get("max") is not None else mean)
+            energies.append(change if change is not None else mean * hours)
+
+        written += store.write(
+            entity_id,
+            statistics_table(
+                timestamps,
+                [friendly_names.get(entity_id, entity_id)] * len(timestamps),
+                seconds,
+                means,
+                mins,
+                maxs,
+                energies,
+            ),
+            table="statistics",
+        )
+
+    return written
+
+
+def _use_statistics(config: dict[str, Any], days: int, keep_days: int) -> bool:
+    mode = config.get("statistics", DEFAULT_COLLECT_CONFIG["statistics"])
+    if mode == "always":
+        return True
+    if mode == "never":
+        return False
+    threshold = config.get(
+        "statistics_after_days", DEFAULT_COLLECT_CONFIG["statistics_after_days"]
+    )
+    return days > threshold or days > keep_days
+
+
+async def _collect_statistics(
+    hass: HomeAssistant,
+    entity_ids: list[str],
+    start_time: datetime,
+    end_time: datetime,
+    state: dict[str, Any],
+    keep_data: bool = False,
+) -> dict[str, Any]:
+    """Collect long-term statistics instead of raw states for long report windows.
+
+    Sample watermarks in the collection state are kept, so a later short-range collection
+    can still resume incrementally.
+    """
+    data_path = _get_paths(hass)["data_path"]
+    days = (end_time - start_time).days
+    period = "5minute" if days <= SHORT_TERM_STATISTICS_DAYS else "hour"
+
+    statistics = await get_instance(hass).async_add_executor_job(
+        _fetch_statistics_sync, hass, entity_ids, start_time, end_time, period
+    )
+    friendly_names = {
+        entity_id: name for entity_id, (name, _) in _entity_metadata(hass, entity_ids).items()
+    }
+
+    rows_written = await hass.async_add_executor_job(
+        _store_statistics_sync, statistics, friendly_names, data_path, period
+    )
+    state["source"] = "statistics"
+    await hass.async_add_executor_job(
+        _write_json, data_path / "collect_state.json", state
+    )
+
+    store = await hass.async_add_executor_job(_open_store, data_path)
+    success = await hass.async_add_executor_job(store.has_data, "statistics")
+    data = None
+    if keep_data and success:
+        data = await hass.async_add_executor_job(store.read, "statistics", entity_ids)
+    return {
+        "success": success,
+        "mode": "statistics",
+        "period": period,
+        "rows_written": rows_written,
+        "store_path": store.root,
+        "csv_file": None,
+        "data": data,
+    }
+
+
+def _load_watermarks(
+    state: dict[str, Any], overlap: timedelta
+) -> dict[str, dict[str, Any]]:
+    watermarks: dict[str, dict[str, Any]] = {}
+    for entity_id, mark in state.get("entities", {}).items():
+        last_changed = float(mark.get("last_changed", 0.0))
+        watermarks[entity_id] = {
+            "last_changed": last_changed,
+            "since": last_changed - overlap.total_seconds(),
+            "recent": set(mark.get("recent", [])),
+        }
+    return watermarks
+
+
+def _dump_watermarks(
+    watermarks: dict[str, dict[str, Any]], overlap: timedelta
+) -> dict[str, dict[str, Any]]:
+    entities: dict[str, dict[str, Any]] = {}
+    for entity_id, mark in watermarks.items():
+        threshold = mark["last_changed"] - overlap.total_seconds()
+        entities[entity_id] = {
+            "last_changed": mark["last_changed"],
+            "recent": sorted(ts for ts in mark["recent"] if ts >= threshold),
+        }
+    return entities
+
+
+async def _collect_history(
+    hass: HomeAssistant,
+    entity_ids: list[str],
+    days: int,
+    full: bool = False,
+    export_csv: bool = False,
+    keep_data: bool = False,
+) -> dict[str, Any]:
+    live = _get_paths(hass).get("live")
+    if live is not None:
+        await live.async_flush()
+    async with _collect_lock(hass):
+        return await _collect_history_locked(
+            hass, entity_ids, days, full, export_csv, keep_data, live
+        )
+
+
+async def _collect_history_locked(
+    hass: HomeAssistant,
+    entity_ids: list[str],
+    days: int,
+    full: bool,
+    export_csv: bool,
+    keep_data: bool,
+    live: Any,
+) -> dict[str, Any]:
+    """Collect recorder history into the Parquet store, fetching only the delta when possible.
+
+    A full collection rebuilds the store for the whole window. Afterwards each entity keeps a
+    watermark (its last persisted ``last_changed``) and later runs only query from the oldest
+    watermark minus the configured overlap, appending states that were not written yet.
+    all.csv is only written when CSV export is requested or enabled in the config.
+    Windows longer than the statistics threshold or the recorder retention are collected
+    from long-term statistics instead (see ``_collect_statistics``).
+
+    With ``keep_data`` the collected rows are also returned as an Arrow table under
+    ``"data"``, ready for ``ShellyEnergyReport.run_analysis(data=...)``; it is None when the
+    window has to be read from a rollup tier, so the generator loads it from the store.
+
+    Entities fully covered by the live buffer since their watermark were already flushed to
+    the store and are not queried from the recorder at all.
+    """
+    paths = _get_paths(hass)
+    data_path = paths["data_path"]
+    csv_file = data_path / "all.csv"
+    state_path = data_path / "collect_state.json"
+    store = await hass.async_add_executor_job(_open_store, data_path)
+
+    config = await _read_json(
+        hass, data_path / "collect_config.json", DEFAULT_COLLECT_CONFIG
+    )
+    state = await _read_json(hass, state_path, {})
+    overlap = timedelta(
+        minutes=config.get("overlap_minutes", DEFAULT_COLLECT_CONFIG["overlap_minutes"])
+    )
+
+    end_time = dt_util.now()
+    start_time = end_time - timedelta(days=days)
+    recorder = get_instance(hass)
+    if _use_statistics(config, days, recorder.keep_days):
+        return await _collect_statistics(
+            hass, entity_ids, start_time, end_time, state, keep_data
+        )
+
+    if not full:
+        await hass.async_add_executor_job(store.merge_appends)
+
+    coverage_start = state.get("coverage_start")
+    has_samples = await hass.async_add_executor_job(store.has_data)
+
+    incremental = (
+        not full
+        and config.get("incremental", True)
+        and coverage_start is not None
+        and coverage_start <= start_time.timestamp()
+        and has_samples
+    )
+
+    windows: dict[datetime, list[str]] = {}
+    live_covered: list[str] = []
+    if incremental:
+        watermarks = _load_watermarks(state, overlap)
+        known = [entity_id for entity_id in entity_ids if entity_id in watermarks]
+        if live is not None:
+            live_covered = [
+                entity_id
+                for entity_id in known
+                if live.covers(
+                    entity_id,
+                    watermarks[entity_id]["last_changed"] - overlap.total_seconds(),
                 )
-        history_data.append(entity_list)
-    return history_data
+            ]
+            known = [entity_id for entity_id in known if entity_id not in live_covered]
+        if known:
+            oldest = min(watermarks[entity_id]["last_changed"] for entity_id in known)
+            since = max(start_time, dt_util.utc_from_timestamp(oldest) - overlap)
+            windows[since] = known
+        new = [entity_id for entity_id in entity_ids if entity_id not in watermarks]
+        if new:
+            windows.setdefault(start_time, []).extend(new)
+    else:
+        watermarks = {}
+        coverage_start = start_time.timestamp()
+        windows[start_time] = list(entity_ids)
+
+    states_map: dict[str, list[Any]] = {}
+    for since, window_ids in windows.items():
+        states_map.update(
+            await recorder.async_add_executor_job(
+                _fetch_history_sync,
+                hass,
+                window_ids,
+                since,
+                end_time,
+                # A start-time state would be stamped at the window start and look new.
+                since == start_time,
+            )
+        )
+
+    blocks = await hass.async_add_executor_job(
+        _store_history_sync,
+        states_map,
+        _entity_metadata(hass, entity_ids),
+        data_path,
+        watermarks,
+        not incremental,
+    )
+    if live is not None:
+        live.async_backfilled(
+            [entity_id for window_ids in windows.values() for entity_id in window_ids],
+            end_time.timestamp(),
+        )
+    await hass.async_add_executor_job(
+        _write_json,
+        state_path,
+        {
+            "source": "samples",
+            "coverage_start": coverage_start,
+            "entities": _dump_watermarks(watermarks, overlap),
+        },
+    )
+
+    exported = export_csv or config.get("export_csv", False)
+    if exported:
+        await hass.async_add_executor_job(_export_store_to_csv, data_path, csv_file)
+
+    success = await hass.async_add_executor_job(store.has_data)
+    data = None
+    if keep_data and success:
+        # Once retention has dropped raw samples of the window, the generator reads the
+        # rollups from the store itself, as a plain generation would.
+        raw = await hass.async_add_executor_job(
+            partial(store.choose_tier, start_time, entity_ids=entity_ids)
+        ) == "samples"
+        if raw and incremental:
+            # Only the delta is in memory; the rest of the window comes from the store.
+            data = await hass.async_add_executor_job(
+                partial(store.read, "samples", entity_ids, start=start_time, end=end_time)
+            )
+        elif raw and blocks:
+            data = await hass.async_add_executor_job(_blocks_table_sync, blocks)
+
+    return {
+        "success": success,
+        "mode": "incremental" if incremental else "full",
+        "rows_written": sum(len(block) for block in blocks),
+        "live_entities": len(live_covered),
+        "store_path": store.root,
+        "csv_file": csv_file if exported else None,
+        "data": data,
+    }
+
+
+def _blocks_table_sync(blocks: list[EntityBlock]) -> Any:
+    from .report_generator.src.store import blocks_table
+
+    return blocks_table(blocks)
+
+
+def _generate_reports_sync(
+    data_path: Path,
+    output_path: Path,
+    data: Any = None,
+    start: datetime | None = None,
+    workers: int = DEFAULT_REPORT_WORKERS,
+    executor: Any = None,
+    save_charts: bool = False,
+) -> None:
+    analyzer = _load_report_generator()(
+        data_dir=str(data_path),
+        output_dir=str(output_path),
+        correct_timestamps=True,
+        workers=workers,
+        executor=executor,
+        save_charts=save_charts,
+    )
+    analyzer.run_analysis(data=data, start=start)
 
 
 class EnergyReportsRootView(HomeAssistantView):
@@ -348,6 +862,10 @@ class EnergyReportsEntitiesSelectView(HomeAssistantView):
         await self.hass.async_add_executor_job(
             _write_json, paths["data_path"] / "selected_entities.json", selected_ids
         )
+        live = paths.get("live")
+        if live is not None and live.started_at is not None:
+            await live.async_flush()
+            live.async_start(selected_ids)
         return web.json_response(
             {"status": "success", "message": f"Saved {len(selected_ids)} entities", "selected": selected_ids}
         )
@@ -497,6 +1015,186 @@ class EnergyReportsCleanupRunView(HomeAssistantView):
         )
 
 
+class EnergyReportsCollectConfigView(HomeAssistantView):
+    url = "/api/energy_reports/api/collect/config"
+    name = "api:energy_reports:collect_config"
+    requires_auth = True
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+
+    async def get(self, request: web.Request) -> web.Response:
+        paths = _get_paths(self.hass)
+        config_path = paths["data_path"] / "collect_config.json"
+        config = await _read_json(self.hass, config_path, DEFAULT_COLLECT_CONFIG)
+        return web.json_response({"status": "success", "config": config})
+
+    async def post(self, request: web.Request) -> web.Response:
+        paths = _get_paths(self.hass)
+        data = await request.json()
+        overlap_minutes = int(
+            data.get("overlap_minutes", DEFAULT_COLLECT_CONFIG["overlap_minutes"]) or 0
+        )
+        statistics = data.get("statistics", DEFAULT_COLLECT_CONFIG["statistics"])
+        if statistics not in STATISTICS_MODES:
+            return web.json_response(
+                {
+                    "status": "error",
+                    "message": f"statistics must be one of {', '.join(STATISTICS_MODES)}",
+                },
+                status=400,
+            )
+        statistics_after_days = int(
+            data.get(
+                "statistics_after_days", DEFAULT_COLLECT_CONFIG["statistics_after_days"]
+            )
+            or 0
+        )
+        config = {
+            "incremental": bool(data.get("incremental", True)),
+            "overlap_minutes": max(overlap_minutes, 0),
+            "export_csv": bool(data.get("export_csv", False)),
+            "statistics": statistics,
+            "statistics_after_days": max(statistics_after_days, 1),
+            "live": bool(data.get("live", True)),
+        }
+        await self.hass.async_add_executor_job(
+            _write_json, paths["data_path"] / "collect_config.json", config
+        )
+        live = paths.get("live")
+        if live is not None and config["live"] != (live.started_at is not None):
+            if config["live"]:
+                live.async_start(
+                    await _read_json(
+                        self.hass, paths["data_path"] / "selected_entities.json", []
+                    )
+                )
+            else:
+                live.async_stop_tracking()
+                await live.async_flush()
+        return web.json_response(
+            {"status": "success", "message": "Collection configuration saved", "config": config}
+        )
+
+
+class EnergyReportsStorageConfigView(HomeAssistantView):
+    url = "/api/energy_reports/api/storage/config"
+    name = "api:energy_reports:storage_config"
+    requires_auth = True
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+
+    async def get(self, request: web.Request) -> web.Response:
+        paths = _get_paths(self.hass)
+        config_path = paths["data_path"] / "storage_config.json"
+        config = await _read_json(self.hass, config_path, DEFAULT_STORAGE_CONFIG)
+        return web.json_response({"status": "success", "config": config})
+
+    async def post(self, request: web.Request) -> web.Response:
+        paths = _get_paths(self.hass)
+        data = await request.json()
+        config = {
+            key: max(int(data.get(key, default) or 0), 0)
+            for key, default in DEFAULT_STORAGE_CONFIG.items()
+        }
+        # A coarser tier has to outlive the finer ones, or compaction would lose data
+        kept = 0
+        # DEFAULT_STORAGE_CONFIG lists the tiers from finest to coarsest
+        for index, (key, days) in enumerate(config.items()):
+            if kept == 0 and index and days:
+                return web.json_response(
+                    {
+                        "status": "error",
+                        "message": f"{key} must be 0 when a finer tier is kept forever",
+                    },
+                    status=400,
+                )
+            if days and days < kept:
+                return web.json_response(
+                    {
+                        "status": "error",
+                        "message": f"{key} must be 0 or at least {kept}",
+                    },
+                    status=400,
+                )
+            kept = days
+        await self.hass.async_add_executor_job(
+            _write_json, paths["data_path"] / "storage_config.json", config
+        )
+        return web.json_response(
+            {"status": "success", "message": "Storage configuration saved", "config": config}
+        )
+
+
+class EnergyReportsReportConfigView(HomeAssistantView):
+    url = "/api/energy_reports/api/report/config"
+    name = "api:energy_reports:report_config"
+    requires_auth = True
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+
+    async def get(self, request: web.Request) -> web.Response:
+        paths = _get_paths(self.hass)
+        config_path = paths["data_path"] / "report_config.json"
+        config = await _read_json(self.hass, config_path, DEFAULT_REPORT_CONFIG)
+        return web.json_response({"status": "success", "config": config})
+
+    async def post(self, request: web.Request) -> web.Response:
+        paths = _get_paths(self.hass)
+        data = await request.json()
+        config = {
+            "workers": max(
+                int(data.get("workers", DEFAULT_REPORT_CONFIG["workers"]) or 0), 0
+            ),
+        }
+        await self.hass.async_add_executor_job(
+            _write_json, paths["data_path"] / "report_config.json", config
+        )
+        # The new pool warms up in the background
+        self.hass.async_create_task(_restart_report_pool(self.hass, config["workers"]))
+        return web.json_response(
+            {"status": "success", "message": "Report configuration saved", "config": config}
+        )
+
+
+class EnergyReportsLiveView(HomeAssistantView):
+    url = "/api/energy_reports/api/live"
+    name = "api:energy_reports:live"
+    requires_auth = True
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+
+    async def get(self, request: web.Request) -> web.Response:
+        live = _get_paths(self.hass).get("live")
+        if live is None or live.started_at is None:
+            return web.json_response(
+                {"status": "error", "message": "Live capture is not running"}, status=404
+            )
+
+        try:
+            limit = max(int(request.query.get("limit", 60)), 1)
+        except ValueError:
+            limit = 60
+        entities = [
+            {
+                "entity_id": entity_id,
+                "friendly_name": live.metadata.get(entity_id, (entity_id, 1.0))[0],
+                "samples": live.samples(entity_id, limit),
+            }
+            for entity_id in live.rings
+        ]
+        return web.json_response(
+            {
+                "status": "success",
+                "started_at": live.started_at,
+                "entities": entities,
+            }
+        )
+
+
 class EnergyReportsDownloadLatestView(HomeAssistantView):
     url = "/api/energy_reports/download/latest"
     name = "api:energy_reports:download_latest"
@@ -592,8 +1290,6 @@ class EnergyReportsApiView(HomeAssistantView):
 
         data = await request.json()
         days = data.get("days", 7)
-        end_time = dt_util.now()
-        start_time = end_time - timedelta(days=days)
 
         if "recorder" not in self.hass.config.components:
             return web.json_response(
@@ -601,53 +1297,54 @@ class EnergyReportsApiView(HomeAssistantView):
                 status=500,
             )
 
-        def _get_history_sync() -> dict[str, list[Any]]:
-            try:
-                return recorder_history.get_significant_states(
-                    self.hass,
-                    start_time,
-                    end_time,
-                    entity_ids=entity_ids,
-                    include_start_time_state=True,
-                    significant_changes_only=True,
-                    minimal_response=True,
-                )
-            except TypeError:
-                return recorder_history.get_significant_states(
-                    self.hass, start_time, end_time, entity_ids
-                )
-
+        generate = bool(data.get("generate", False))
         try:
-            recorder = get_instance(self.hass)
-            states_map = await recorder.async_add_executor_job(_get_history_sync)
+            result = await _collect_history(
+                self.hass,
+                entity_ids,
+                days,
+                full=bool(data.get("full", False)),
+                export_csv=bool(data.get("export_csv", False)),
+                keep_data=generate,
+            )
         except Exception as exc:
             return web.json_response(
                 {"status": "error", "message": f"History fetch failed: {exc}"},
                 status=500,
             )
 
-        history_data = _history_to_json(entity_ids, states_map)
-
-        csv_file = paths["data_path"] / "all.csv"
-        success = await self.hass.async_add_executor_job(
-            _convert_history_to_csv, history_data, csv_file
-        )
-
-        if not success:
+        if not result["success"]:
             return web.json_response(
-                {"status": "error", "message": "Failed to convert history data to CSV"},
+                {"status": "error", "message": "No numeric history found for the selected entities"},
                 status=500,
             )
 
-        return web.json_response(
-            {
-                "status": "success",
-                "message": "Data collected successfully from Home Assistant history",
-                "entities_count": len(entity_ids),
-                "entities": entity_ids,
-                "csv_file": str(csv_file),
-            }
-        )
+        response = {
+            "status": "success",
+            "message": "Data collected successfully from Home Assistant history",
+            "entities_count": len(entity_ids),
+            "entities": entity_ids,
+            "mode": result["mode"],
+            "rows_written": result["rows_written"],
+            "store_path": str(result["store_path"]),
+            "csv_file": str(result["csv_file"]) if result["csv_file"] else None,
+        }
+        if generate:
+            await self.hass.async_add_executor_job(
+                _generate_reports_sync,
+                paths["data_path"],
+                paths["output_path"],
+                result["data"],
+                dt_util.utcnow() - timedelta(days=days),
+                await _report_workers(self.hass),
+                paths.get("report_pool"),
+            )
+            await _sync_pdfs(self.hass, paths["output_path"], paths["pdf_path"])
+            response["device_reports"] = [
+                pdf.name for pdf in paths["pdf_path"].glob("report_*.pdf")
+            ]
+
+        return web.json_response(response)
 
 
 class EnergyReportsGenerateView(HomeAssistantView):
@@ -664,22 +1361,41 @@ class EnergyReportsGenerateView(HomeAssistantView):
         output_path = paths["output_path"]
         pdf_path = paths["pdf_path"]
 
-        main_csv = data_path / "all.csv"
-        if not main_csv.exists():
+        data = await request.json() if request.can_read_body else {}
+        days = data.get("days")
+        start = dt_util.utcnow() - timedelta(days=int(days)) if days else None
+        # An explicit worker count runs on its own pool (or serially) instead of the warm one
+        if "workers" in data:
+            workers = max(int(data["workers"] or 0), 0)
+            executor = None
+        else:
+            workers = await _report_workers(self.hass)
+            executor = paths.get("report_pool")
+        # Chart PNGs are only written on request; the PDFs embed the charts from memory
+        save_charts = bool(data.get("save_charts", False))
+
+        live = paths.get("live")
+        if live is not None:
+            await live.async_flush()
+        async with _collect_lock(self.hass):
+            await self.hass.async_add_executor_job(_merge_store_sync, data_path)
+
+        if not await self.hass.async_add_executor_job(_has_collected_data_sync, data_path):
             return web.json_response(
-                {"status": "error", "message": "No CSV data found. Collect data first."},
+                {"status": "error", "message": "No collected data found. Collect data first."},
                 status=404,
             )
 
-        def _run_report() -> None:
-            analyzer = ShellyEnergyReport(
-                data_dir=str(data_path),
-                output_dir=str(output_path),
-                correct_timestamps=True,
-            )
-            analyzer.run_analysis()
-
-        await self.hass.async_add_executor_job(_run_report)
+        await self.hass.async_add_executor_job(
+            _generate_reports_sync,
+            data_path,
+            output_path,
+            None,
+            start,
+            workers,
+            executor,
+            save_charts,
+        )
 
         await _sync_pdfs(self.hass, output_path, pdf_path)
 
@@ -11,9 +11,13 @@ from datetime import datetime, timedelta
 import os
 import requests
 import csv
+import heapq
+import itertools
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from io import StringIO
+from requests.adapters import HTTPAdapter
 
 # Add report generator to path
 sys.path.insert(0, str(Path(__file__).parent / 'report_generator' / 'src'))
@@ -117,6 +121,27 @@ HEADERS = {"Content-Type": "application/json"}
 if AUTH_TOKEN:
     HEADERS["Authorization"] = f"Bearer {AUTH_TOKEN}"
 
+# History fetching: the range is split into windows x entity batches fetched concurrently
+HISTORY_WINDOW_HOURS = max(1, int(os.getenv('HISTORY_WINDOW_HOURS', '24')))
+HISTORY_BATCH_SIZE = max(1, int(os.getenv('HISTORY_BATCH_SIZE', '10')))
+HISTORY_WORKERS = max(1, int(os.getenv('HISTORY_WORKERS', '4')))
+HISTORY_RETRIES = max(1, int(os.getenv('HISTORY_RETRIES', '3')))
+HISTORY_TIMEOUT = max(1, int(os.getenv('HISTORY_TIMEOUT', '60')))
+
+
+def _create_http_session():
+    """Keep-alive session shared by all HA API calls, with a connection pool per worker."""
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HISTORY_WORKERS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+HTTP_SESSION = _create_http_session()
+
 # Data collection thread
 collection_thread = None
 auto_update_thread = None
@@ -176,7 +201,7 @@ def auto_update_worker():
                 history_data = get_history_from_ha(entity_ids, start_time, end_time)
                 if history_data:
                     csv_file = DATA_PATH / 'all.csv'
-                    convert_history_to_csv(history_data, csv_file, entity_ids)
+                    convert_history_to_csv(history_data, csv_file)
                     logger.info(f"[SUCCESS] Auto-report: Data saved to {csv_file}")
                     
                     # Generate reports
@@ -202,6 +227,34 @@ def auto_update_worker():
     logger.info("[INFO] Auto-report worker stopped")
 
 
+def _fetch_history_window(entity_ids, start_time, end_time, skip_initial_state):
+    """Fetch one window for one entity batch, retrying it on its own; None if every attempt failed"""
+    start_str = start_time.strftime('%Y-%m-%dT%H:%M:%S')
+    end_str = end_time.strftime('%Y-%m-%dT%H:%M:%S')
+    url = f"{HA_API_URL}/history/period/{start_str}"
+    params = {
+        'filter_entity_id': ','.join(entity_ids),
+        'end_time': end_str
+    }
+    if skip_initial_state:
+        # Only the first window needs the state in effect at its start
+        params['skip_initial_state'] = ''
+    
+    for attempt in range(1, HISTORY_RETRIES + 1):
+        try:
+            response = HTTP_SESSION.get(url, params=params, timeout=HISTORY_TIMEOUT)
+            if response.status_code == 200:
+                return response.json()
+            logger.warning(f"History window {start_str} - {end_str} failed: {response.status_code} (attempt {attempt}/{HISTORY_RETRIES})")
+        except requests.RequestException as e:
+            logger.warning(f"History window {start_str} - {end_str} failed: {e} (attempt {attempt}/{HISTORY_RETRIES})")
+        if attempt < HISTORY_RETRIES:
+            time.sleep(2 ** attempt)
+    
+    logger.error(f"History window {start_str} - {end_str} failed after {HISTORY_RETRIES} attempts, skipping it")
+    return None
+
+
 def get_history_from_ha(entity_ids, start_time=None, end_time=None):
     """Get historical data from Home Assistant for specified entities"""
     try:
@@ -211,28 +264,58 @@ def get_history_from_ha(entity_ids, start_time=None, end_time=None):
         if start_time is None:
             start_time = end_time - timedelta(days=7)
         
-        # Format timestamps for HA API
-        start_str = start_time.strftime('%Y-%m-%dT%H:%M:%S')
-        end_str = end_time.strftime('%Y-%m-%dT%H:%M:%S')
-        
-        logger.info(f"Fetching history from {start_str} to {end_str}")
+        logger.info(f"Fetching history from {start_time:%Y-%m-%dT%H:%M:%S} to {end_time:%Y-%m-%dT%H:%M:%S}")
         logger.info(f"For {len(entity_ids)} entities")
         
-        # HA History API endpoint
-        url = f"{HA_API_URL}/history/period/{start_str}"
-        params = {
-            'filter_entity_id': ','.join(entity_ids),
-            'end_time': end_str
-        }
-        
-        response = requests.get(url, headers=HEADERS, params=params, timeout=30)
-        
-        if response.status_code != 200:
-            logger.error(f"Failed to get history: {response.status_code}")
+        windows = []
+        window_start = start_time
+        while window_start < end_time:
+            window_end = min(window_start + timedelta(hours=HISTORY_WINDOW_HOURS), end_time)
+            windows.append((window_start, window_end))
+            window_start = window_end
+        batches = [entity_ids[i:i + HISTORY_BATCH_SIZE] for i in range(0, len(entity_ids), HISTORY_BATCH_SIZE)]
+        tasks = [
+            (batch, window_start, window_end, window_start != start_time)
+            for window_start, window_end in windows
+            for batch in batches
+        ]
+        logger.info(f"History split into {len(windows)} windows x {len(batches)} batches")
+        
+        # map() yields results in task order, so states stay chronological per entity
+        with ThreadPoolExecutor(max_workers=HISTORY_WORKERS) as executor:
+            results = list(executor.map(lambda task: _fetch_history_window(*task), tasks))
+        
+        missing = [task for task, result in zip(tasks, results) if result is None]
+        if len(missing) == len(tasks):
+            logger.error("Every history window failed")
             return None
+        for batch, window_start, window_end, _ in missing:
+            logger.warning(
+                f"History missing from {window_start:%Y-%m-%dT%H:%M:%S} to {window_end:%Y-%m-%dT%H:%M:%S} "
+                f"for {', '.join(batch)}"
+            )
         
-        history_data = response.json()
-        logger.info(f"Retrieved history data for {len(history_data)} entities")
+        merged = {}
+        seen = {}
+        for result in results:
+            if result is None:
+                continue
+            for entity_history in result:
+                if not entity_history:
+                    continue
+                entity_id = entity_history[0].get('entity_id')
+                states = merged.setdefault(entity_id, [])
+                timestamps = seen.setdefault(entity_id, set())
+                for state in entity_history:
+                    # Windows share their boundaries, drop states returned twice
+                    if state.get('last_changed') in timestamps:
+                        continue
+                    timestamps.add(state.get('last_changed'))
+                    states.append(state)
+        
+        history_data = list(merged.values())
+        logger.info(f"Retrieved history data for {len(history_data)} entities"
+                    + (f" ({len(missing)} of {len(tasks)} windows missing)" if missing else ""))
         
         return history_data
         
@@ -241,72 +324,62 @@ def get_history_from_ha(entity_ids, start_time=None, end_time=None):
         return None
 
 
+def _iter_entity_history_rows(entity_history):
+    """Yield (timestamp, entity_id, friendly_name, value) for the numeric states of one entity"""
+    for state in entity_history:
+        try:
+            timestamp = datetime.fromisoformat(state['last_changed'].replace('Z', '+00:00'))
+            
+            # Try to get numeric value
+            try:
+                value = float(state['state'])
+            except (ValueError, TypeError):
+                continue
+            
+            entity_id = state['entity_id']
+            friendly_name = state.get('attributes', {}).get('friendly_name', entity_id)
+            
+            yield int(timestamp.timestamp()), entity_id, friendly_name, value
+        except Exception as e:
+            logger.debug(f"Error processing state: {e}")
+            continue
+
+
 def convert_history_to_csv(history_data, output_file):
-    """Convert HA history data to CSV format"""
+    """Convert HA history data to CSV format
+    
+    Every entity history is already sorted by time, so the per-entity rows are merged
+    with a heap and written while streaming instead of being collected and sorted.
+    """
     try:
         logger.info(f"Converting history data to CSV: {output_file}")
         
-        all_rows = []
-        
-        for entity_history in history_data:
-            if not entity_history:
-                continue
-                
-            for state in entity_history:
-                try:
-                    timestamp = datetime.fromisoformat(state['last_changed'].replace('Z', '+00:00'))
-                    
-                    # Try to get numeric value
-                    value = 0.0
-                    try:
-                        value = float(state['state'])
-                    except (ValueError, TypeError):
-                        continue
-                    
-                    entity_id = state['entity_id']
-                    friendly_name = state.get('attributes', {}).get('friendly_name', entity_id)
-                    
-                    all_rows.append({
-                        'timestamp': int(timestamp.timestamp()),
-                        'entity_id': entity_id,
-                        'friendly_name': friendly_name,
-                        'value': value
-                    })
-                except Exception as e:
-                    logger.debug(f"Error processing state: {e}")
-                    continue
+        rows = heapq.merge(
+            *(_iter_entity_history_rows(entity_history) for entity_history in history_data if entity_history),
+            key=lambda row: row[0]
+        )
+        first_row = next(rows, None)
         
-        if not all_rows:
+        if first_row is None:
             logger.warning("No valid data points found in history")
             return False
         
-        # Sort by timestamp
-        all_rows.sort(key=lambda x: x['timestamp'])
-        
         # Write to CSV with entity_id - NO AGGREGATION, keep per-device data
         output_file.parent.mkdir(parents=True, exist_ok=True)
+        written = 0
         with open(output_file, 'w', newline='') as f:
-            fieldnames = ['timestamp', 'entity_id', 'friendly_name', 'total_act_energy', 'max_act_power', 'avg_voltage', 'avg_current']
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
+            writer = csv.writer(f)
+            writer.writerow(['timestamp', 'entity_id', 'friendly_name', 'total_act_energy', 'max_act_power', 'avg_voltage', 'avg_current'])
             
-            for row in all_rows:
+            for timestamp, entity_id, friendly_name, power in itertools.chain((first_row,), rows):
                 # Calculate metrics per device
-                power = row['value']
                 voltage = 230.0  # Default voltage
                 current = power / voltage if voltage > 0 else 0
                 
-                writer.writerow({
-                    'timestamp': row['timestamp'],
-                    'entity_id': row['entity_id'],
-                    'friendly_name': row['friendly_name'],
-                    'total_act_energy': power,
-                    'max_act_power': power,
-                    'avg_voltage': voltage,
-                    'avg_current': current
-                })
+                writer.writerow([timestamp, entity_id, friendly_name, power, power, voltage, current])
+                written += 1
         
-        logger.info(f"[SUCCESS] Wrote {len(all_rows)} data points to {output_file}")
+        logger.info(f"[SUCCESS] Wrote {written} data points to {output_file}")
         return True
         
     except Exception as e:
@@ -345,19 +418,23 @@ class ShellyDataCollector:
         self.csv_file = DATA_PATH / "all.csv"
         self.running = False
         
-    def get_entity_state(self, entity_id):
-        """Get entity state from Home Assistant"""
+    def get_states(self):
+        """Get the current state of all selected entities with a single /api/states call"""
         try:
-            url = f"{HA_API_URL}/states/{entity_id}"
-            response = requests.get(url, headers=HEADERS, timeout=10)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.error(f"Failed to get state for {entity_id}: {response.status_code}")
-                return None
+            url = f"{HA_API_URL}/states"
+            response = HTTP_SESSION.get(url, timeout=10)
+            if response.status_code != 200:
+                logger.error(f"Failed to get states: {response.status_code}")
+                return {}
+            selected = set(self.entity_ids)
+            return {
+                state['entity_id']: state
+                for state in response.json()
+                if state.get('entity_id') in selected
+            }
         except Exception as e:
-            logger.error(f"Error getting state for {entity_id}: {e}")
-            return None
+            logger.error(f"Error getting states: {e}")
+            return {}
     
     def collect_and_save(self):
         """Collect data from all entities and save to CSV"""
@@ -368,10 +445,10 @@ class ShellyDataCollector:
             
             # Collect data from all entities
             raw_data = {}
+            states = self.get_states()
             
             for entity_id in self.entity_ids:
-                logger.info(f"Collecting data from: {entity_id}")
-                state_data = self.get_entity_state(entity_id)
+                state_data = states.get(entity_id)
                 if state_data:
                     # Extract friendly name and value
                     friendly_name = state_data.get('attributes', {}).get('friendly_name', entity_id)
@@ -380,14 +457,14 @@ class ShellyDataCollector:
                     # Try to convert to float
                     try:
                         value = float(value)
-                        logger.info(f"  [OK] {friendly_name}: {value}")
+                        logger.debug(f"  [OK] {friendly_name}: {value}")
                     except:
                         value = 0.0
                         logger.warning(f"  [WARN] {friendly_name}: Cannot convert to float, using 0.0")
                     
                     raw_data[friendly_name] = value
                 else:
-                    logger.error(f"  [FAIL] Failed to get data from {entity_id}")
+                    logger.error(f"  [FAIL] No state for {entity_id}")
             
             # Map Shelly data to standard column names expected by report generator
             # Potenza = Active Power (W), Potenza apparente = Apparent Power (VA)
@@ -474,9 +551,11 @@ def start_background_collection():
     # Read configuration
     auto_export = os.getenv('AUTO_EXPORT', 'true').lower() == 'true'
     interval_hours = int(os.getenv('EXPORT_INTERVAL', '1'))
+    # Polling is one request regardless of the number of sensors, so sub-hour intervals are cheap
+    interval_seconds = max(int(os.getenv('COLLECT_INTERVAL_SECONDS', '0')), 0) or interval_hours * 3600
     
     logger.info(f"Auto-export enabled: {auto_export}")
-    logger.info(f"Export interval: {interval_hours} hours")
+    logger.info(f"Export interval: {interval_seconds} seconds")
     
     # Check for selected entities first
     config_file = DATA_PATH / 'selected_entities.json'
@@ -497,7 +576,7 @@ def start_background_collection():
         entity_ids = [e['entity_id'] if isinstance(e, dict) else e for e in discovered]
     
     if entity_ids and auto_export:
-        collector = ShellyDataCollector(entity_ids, interval_seconds=interval_hours * 3600)
+        collector = ShellyDataCollector(entity_ids, interval_seconds=interval_seconds)
         collection_thread = threading.Thread(target=collector.start_collection, daemon=True)
         collection_thread.start()
         logger.info("=" * 60)
@@ -518,7 +597,7 @@ def discover_shelly_entities():
         logger.info("Discovering Shelly entities from Home Assistant...")
         
         url = f"{HA_API_URL}/states"
-        response = requests.get(url, headers=HEADERS, timeout=10)
+        response = HTTP_SESSION.get(url, timeout=10)
         
         if response.status_code != 200:
             logger.error(f"Failed to get states from HA API: {response.status_code}")
@@ -1,29 +1,357 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+import pyarrow as pa
+import matplotlib
+import PIL
 from datetime import datetime, timedelta
-import matplotlib.dates as mdates
 from pathlib import Path
 import glob
 import os
 import warnings
 import json
+import hashlib
+import io
+import contextlib
+import multiprocessing
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 from typing import Dict, List
 import shutil
+import tempfile
+import reportlab
 from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle, PageBreak
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Flowable
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch, cm
 from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
 from reportlab.pdfgen import canvas
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 
+try:
+    from .charts import RenderedChart, renderer as chart_renderer
+    from .worker import resolve_workers
+    from .store import (
+        EXPANDERS, LOAD_CACHE_DIRNAME, REPORT_CACHE_DIRNAME, EnergyDataStore, LoadCache, ReportCache,
+        encode_categories, expand_table,
+        filter_rows, read_report_csv, tier_retention, CATEGORY_COLUMNS, CSV_COLUMN_TYPES, NOMINAL_VOLTAGE
+    )
+except ImportError:
+    from charts import RenderedChart, renderer as chart_renderer
+    from worker import resolve_workers
+    from store import (
+        EXPANDERS, LOAD_CACHE_DIRNAME, REPORT_CACHE_DIRNAME, EnergyDataStore, LoadCache, ReportCache,
+        encode_categories, expand_table,
+        filter_rows, read_report_csv, tier_retention, CATEGORY_COLUMNS, CSV_COLUMN_TYPES, NOMINAL_VOLTAGE
+    )
+
 warnings.filterwarnings('ignore')
 
-# Chart style configuration
-plt.style.use('seaborn-v0_8-darkgrid')
-sns.set_palette("husl")
+# Measurement columns are kept as float32 in the analysis frame
+MEASUREMENT_COLUMNS = tuple(name for name, type_ in CSV_COLUMN_TYPES.items() if type_ == pa.float32())
+EPOCH_DATE = datetime(1970, 1, 1).date()
+SECONDS_PER_DAY = 86400
+REPORT_CHARTS_NAME = "charts.json"
+# Target number of points per chart when choosing a storage tier for the report window
+CHART_POINTS = 2000
+
+
+def day_to_date(epoch_day):
+    """Calendar date of an epoch-day code (days since 1970-01-01)."""
+    return EPOCH_DATE + timedelta(days=int(epoch_day))
+
+
+def date_to_day(day) -> int:
+    """Epoch-day code of a calendar date."""
+    return (day - EPOCH_DATE).days
+
+
+TIME_BANDS = ('night', 'morning', 'afternoon', 'evening')  # 6-hour bands starting at midnight
+WEEKEND_DAYS = (5, 6)
+
+
+def build_analysis_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregate rows into an (entity_id, epoch_day, hour) cube in one grouped pass.
+    
+    Each cell holds the row count plus count/sum/min/max of max_act_power, the energy sum,
+    count/sum/sum-of-squares/min/max and in-range (220-240 V) count of avg_voltage, and
+    count/sum/min/max of the estimated power factor, so the analysis helpers can derive
+    their metrics without rescanning the rows.
+    """
+    keys = [key for key in ('entity_id', 'epoch_day', 'hour') if key in df.columns]
+    if len(df) == 0 or 'epoch_day' not in keys or 'hour' not in keys:
+        return pd.DataFrame()
+    
+    columns = {key: df[key] for key in keys}
+    aggregations = {'rows': ('epoch_day', 'size')}
+    if 'max_act_power' in df.columns:
+        columns['power'] = df['max_act_power']
+        aggregations.update(
+            power_count=('power', 'count'), power_sum=('power', 'sum'),
+            power_min=('power', 'min'), power_max=('power', 'max'),
+        )
+    if 'total_act_energy' in df.columns:
+        columns['energy'] = df['total_act_energy']
+        aggregations['energy_sum'] = ('energy', 'sum')
+    if 'avg_voltage' in df.columns:
+        voltage = df['avg_voltage'].astype(np.float64)
+        columns['voltage'] = voltage
+        columns['voltage_sq'] = voltage ** 2
+        columns['voltage_stable'] = voltage.between(220, 240)
+        aggregations.update(
+            voltage_count=('voltage', 'count'), voltage_sum=('voltage', 'sum'),
+            voltage_sumsq=('voltage_sq', 'sum'), voltage_min=('voltage', 'min'),
+            voltage_max=('voltage', 'max'), voltage_stable=('voltage_stable', 'sum'),
+        )
+    if 'total_act_energy' in df.columns and 'lag_react_energy' in df.columns:
+        active = df['total_act_energy'].astype(np.float64)
+        columns['pf'] = active / np.sqrt(active**2 + df['lag_react_energy']**2 + 1e-6)
+        aggregations.update(
+            pf_count=('pf', 'count'), pf_sum=('pf', 'sum'), pf_min=('pf', 'min'), pf_max=('pf', 'max'),
+        )
+    
+    cube = pd.DataFrame(columns).groupby(keys, observed=True, sort=True).agg(**aggregations)
+    return cube.reset_index()
+
+
+def cube_from_rollup(hourly: pa.Table) -> pd.DataFrame:
+    """
+    Rebuild the analysis cube of raw samples from their persisted hourly rollup.
+    
+    Samples expand to power = energy = value at nominal voltage, so each hourly bucket
+    maps onto the same cell build_analysis_cube would compute from the expanded rows.
+    """
+    if hourly.num_rows == 0:
+        return pd.DataFrame()
+    frame = hourly.select(['entity_id', 'timestamp', 'count', 'sum', 'min', 'max']).to_pandas()
+    seconds = frame['timestamp'].to_numpy()
+    count = frame['count'].to_numpy()
+    cube = pd.DataFrame({
+        'entity_id': frame['entity_id'],
+        'epoch_day': (seconds // SECONDS_PER_DAY).astype(np.int32),
+        'hour': (seconds % SECONDS_PER_DAY // 3600).astype(np.int8),
+        'rows': count,
+        'power_count': count,
+        'power_sum': frame['sum'],
+        'power_min': frame['min'],
+        'power_max': frame['max'],
+        'energy_sum': frame['sum'],
+        'voltage_count': count,
+        'voltage_sum': count * NOMINAL_VOLTAGE,
+        'voltage_sumsq': count * NOMINAL_VOLTAGE**2,
+        'voltage_min': NOMINAL_VOLTAGE,
+        'voltage_max': NOMINAL_VOLTAGE,
+        'voltage_stable': count,
+    })
+    return cube.sort_values(['entity_id', 'epoch_day', 'hour'], ignore_index=True)
+
+
+def _frame_to_ipc(df: pd.DataFrame) -> bytes:
+    """Serialize a frame as an Arrow IPC stream (categoricals travel as dictionaries)."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _frame_from_ipc(payload: bytes) -> pd.DataFrame:
+    return pa.ipc.open_stream(payload).read_all().to_pandas()
+
+
+@lru_cache(maxsize=None)
+def _code_version() -> str:
+    """Hash of the generator sources and chart/PDF library versions, part of every report cache key."""
+    digest = hashlib.blake2b(digest_size=16)
+    for name in ('main.py', 'store.py', 'charts.py', 'worker.py'):
+        digest.update(Path(__file__).with_name(name).read_bytes())
+    digest.update(f"{matplotlib.__version__} {reportlab.Version} {PIL.__version__}".encode())
+    return digest.hexdigest()
+
+
+def _hour_bound(value, ceil: bool = False):
+    """Epoch seconds of value (datetime or seconds) aligned to a whole UTC hour."""
+    if value is None:
+        return None
+    seconds = int(value.timestamp()) if isinstance(value, datetime) else int(value)
+    return -(-seconds // 3600) * 3600 if ceil else seconds // 3600 * 3600
+
+
+def _ratio(numerator, denominator) -> float:
+    return float(numerator / denominator) if denominator else float('nan')
+
+
+def _power_summary(df: pd.DataFrame) -> Dict:
+    """
+    Average, maximum and minimum power and the number of samples behind report rows.
+    
+    Rollup rows stand for sample_count samples each, so their bucket means are weighted by it;
+    other rows count once and are averaged on max_act_power.
+    """
+    if 'sample_count' in df.columns:
+        counts = df['sample_count'].to_numpy(dtype=np.float64)
+    else:
+        counts = np.ones(len(df))
+    summary = {'data_points': int(counts.sum())}
+    mean_column = 'avg_act_power' if 'avg_act_power' in df.columns else 'max_act_power'
+    if mean_column in df.columns:
+        means = df[mean_column].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(means)
+        summary['avg_power_w'] = _ratio((means[valid] * counts[valid]).sum(), counts[valid].sum())
+    if 'max_act_power' in df.columns:
+        summary['max_power_w'] = df['max_act_power'].max()
+    min_column = 'min_act_power' if 'min_act_power' in df.columns else 'max_act_power'
+    if min_column in df.columns:
+        summary['min_power_w'] = df[min_column].min()
+    return summary
+
+
+ALL_DEVICES = '__all__'
+CO2_KG_PER_KWH = 0.233  # media Italia
+CO2_KG_PER_TREE_YEAR = 22
+CO2_KG_PER_CAR_KM = 0.12
+
+
+def _divide(numerator, denominator):
+    """Element-wise ratio that is NaN where the denominator is zero."""
+    return numerator / denominator.where(denominator != 0)
+
+
+def analyze_fleet(df: pd.DataFrame, cube: pd.DataFrame = None, per_entity: bool = True) -> pd.DataFrame:
+    """
+    Compute the analysis metrics of every device at once.
+    
+    Returns one row per entity_id (or a single ALL_DEVICES row when per_entity is False
+    or the frame has no entity_id) with the time-band, weekday/weekend, anomaly,
+    environmental, prediction and power-quality metrics. All metrics are grouped
+    operations on the (entity_id, epoch_day, hour) cube; only the top peaks look at rows.
+    """
+    cube = build_analysis_cube(df) if cube is None else cube
+    if cube.empty:
+        return pd.DataFrame()
+    
+    by_entity = per_entity and 'entity_id' in cube.columns
+    cells = cube.assign(
+        device=cube['entity_id'].astype(str) if by_entity else ALL_DEVICES,
+        band=cube['hour'] // 6,
+    )
+    devices = cells.groupby('device')
+    results = pd.DataFrame(index=pd.Index(sorted(cells['device'].unique()), name='device'))
+    results['rows'] = devices['rows'].sum()
+    
+    if 'power_sum' in cells.columns:
+        # Profilo orario e fasce orarie
+        hourly = cells.groupby(['device', 'hour'])[['power_sum', 'power_count']].sum()
+        hourly_avg = _divide(hourly['power_sum'], hourly['power_count']).unstack('hour').reindex(results.index)
+        values = hourly_avg.to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values).all(axis=1)
+        hours = hourly_avg.columns.to_numpy()
+        peak = np.nanargmax(np.where(np.isnan(values), -np.inf, values), axis=1)
+        lowest = np.nanargmin(np.where(np.isnan(values), np.inf, values), axis=1)
+        results['peak_hour'] = np.where(valid, hours[peak], -1)
+        results['lowest_hour'] = np.where(valid, hours[lowest], -1)
+        results['peak_hour_power'] = np.nanmax(np.where(valid[:, None], values, 0), axis=1)
+        results['lowest_hour_power'] = np.nanmin(np.where(valid[:, None], values, 0), axis=1)
+        
+        band_columns = ['rows', 'power_sum', 'power_count'] + (['energy_sum'] if 'energy_sum' in cells.columns else [])
+        bands = cells.groupby(['device', 'band'])[band_columns].sum().unstack('band', fill_value=0).reindex(results.index)
+        total_energy = devices['energy_sum'].sum() if 'energy_sum' in cells.columns else None
+        for band_index, band in enumerate(TIME_BANDS):
+            band_rows = bands['rows'].get(band_index, pd.Series(0, index=results.index)).fillna(0)
+            results[f'{band}_rows'] = band_rows
+            if band_index in bands['rows'].columns:
+                results[f'{band}_avg_power'] = _divide(bands['power_sum'][band_index], bands['power_count'][band_index])
+                if total_energy is not None:
+                    results[f'{band}_total_energy'] = bands['energy_sum'][band_index] / 1000
+                    results[f'{band}_percentage'] = _divide(bands['energy_sum'][band_index] * 100, total_energy)
+        
+        # Consumi notturni (00:00-06:00) contro diurni (06:00-22:00)
+        night = cells[cells['hour'] < 6].groupby('device')[['rows', 'power_sum', 'power_count']].sum()
+        day = cells[(cells['hour'] >= 6) & (cells['hour'] < 22)].groupby('device')[['power_sum', 'power_count']].sum()
+        results['night_rows'] = night['rows'].reindex(results.index, fill_value=0)
+        results['night_avg'] = _divide(night['power_sum'], night['power_count']).reindex(results.index)
+        results['day_avg'] = _divide(day['power_sum'], day['power_count']).reindex(results.index)
+        
+        # Picchi
+        peak_columns = [col for col in ('datetime', 'epoch_day', 'max_act_power') if col in df.columns]
+        rows = df[peak_columns].dropna(subset=['max_act_power'])
+        rows = rows.assign(device=df['entity_id'].astype(str) if by_entity else ALL_DEVICES)
+        top = rows.sort_values('max_act_power', ascending=False, kind='stable').groupby('device').head(5)
+        results['top_peaks'] = pd.Series(
+            {device: group.drop(columns='device').to_dict('records') for device, group in top.groupby('device')},
+            dtype=object,
+        ).reindex(results.index)
+    
+    if 'energy_sum' in cells.columns:
+        # Impatto ambientale
+        results['total_kwh'] = devices['energy_sum'].sum() / 1000
+        results['co2_kg'] = results['total_kwh'] * CO2_KG_PER_KWH
+        
+        # Consumo giornaliero: weekend/feriali e previsioni
+        daily = cells.groupby(['device', 'epoch_day'])['energy_sum'].sum() / 1000
+        weekend = ((daily.index.get_level_values('epoch_day') + 3) % 7).isin(WEEKEND_DAYS)
+        results['weekday_avg'] = daily[~weekend].groupby(level='device').mean()
+        results['weekend_avg'] = daily[weekend].groupby(level='device').mean()
+        
+        by_device = daily.groupby(level='device')
+        results['days'] = by_device.size()
+        results['last_7_avg'] = daily.groupby(level='device').tail(7).groupby(level='device').mean()
+        previous = daily.groupby(level='device').tail(14).groupby(level='device').head(7)
+        results['previous_7_avg'] = previous.groupby(level='device').mean()
+        best = daily.sort_values(kind='stable').groupby(level='device').head(3)
+        results['best_days_avg'] = best.groupby(level='device').mean()
+        results['best_days'] = pd.Series(
+            {device: [day_to_date(day) for day in group.index.get_level_values('epoch_day')]
+             for device, group in best.groupby(level='device')},
+            dtype=object,
+        ).reindex(results.index)
+    
+    if 'voltage_count' in cells.columns:
+        voltage = devices[['voltage_count', 'voltage_sum', 'voltage_sumsq', 'voltage_stable']].sum()
+        variance = _divide(
+            voltage['voltage_sumsq'] - voltage['voltage_sum'] ** 2 / voltage['voltage_count'].where(voltage['voltage_count'] > 0),
+            voltage['voltage_count'] - 1,
+        )
+        results['voltage_min'] = devices['voltage_min'].min()
+        results['voltage_max'] = devices['voltage_max'].max()
+        results['voltage_avg'] = _divide(voltage['voltage_sum'], voltage['voltage_count'])
+        results['voltage_std'] = np.sqrt(variance.where(voltage['voltage_count'] > 1).clip(lower=0))
+        results['voltage_stability_pct'] = voltage['voltage_stable'] / results['rows'] * 100
+    
+    if 'pf_count' in cells.columns:
+        results['pf_count'] = devices['pf_count'].sum()
+        results['pf_min'] = devices['pf_min'].min()
+        results['pf_max'] = devices['pf_max'].max()
+        results['pf_avg'] = _divide(devices['pf_sum'].sum(), results['pf_count'])
+    
+    return results
+
+
+def _json_default(value):
+    """Serialize numpy scalars (float32 aggregates, int8 codes) as plain numbers."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class ChartImage(Flowable):
+    """A rendered chart drawn from memory through ImageReader, without a PNG round-trip."""
+
+    def __init__(self, chart: RenderedChart, width: float, height: float):
+        super().__init__()
+        self.chart = chart
+        self.width = width
+        self.height = height
+        self.hAlign = 'CENTER'
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def draw(self):
+        self.canv.drawImage(ImageReader(self.chart.image()), 0, 0, self.width, self.height)
+
 
 class PDFReportGenerator:
     """Professional PDF report generator."""
@@ -155,7 +483,7 @@ class PDFReportGenerator:
             ))
     
     def create_daily_pdf(self, analysis: Dict, date: datetime.date, output_path: Path, 
-                         plot_paths: List[Path], day_data: pd.DataFrame):
+                         charts: List[RenderedChart], day_data: pd.DataFrame):
         """Create daily report PDF."""
         pdf_path = output_path / f"report_giornaliero_{date.strftime('%Y%m%d')}.pdf"
         
@@ -212,15 +540,10 @@ class PDFReportGenerator:
         story.append(Paragraph("GRAFICI ANALISI", self.styles['SectionTitle']))
         
         # Add charts
-        for plot_path in plot_paths:
-            if plot_path.exists():
-                story.append(Paragraph(f"Grafico: {plot_path.stem}", self.styles['SubTitle']))
-                try:
-                    img = Image(str(plot_path), width=6*inch, height=4*inch)
-                    story.append(img)
-                    story.append(Spacer(1, 10))
-                except Exception as e:
-                    story.append(Paragraph(f"Errore nel caricamento del grafico: {str(e)}", self.styles['Normal']))
+        for chart in charts:
+            story.append(Paragraph(f"Grafico: {chart.name}", self.styles['SubTitle']))
+            story.append(ChartImage(chart, width=6*inch, height=4*inch))
+            story.append(Spacer(1, 10))
         
         # Detailed hourly analysis
         story.append(Paragraph("🕒 ANALISI ORARIA DETTAGLIATA", self.styles['SectionTitle']))
@@ -304,7 +627,7 @@ class PDFReportGenerator:
             print(f"[ERROR] Error creating PDF: {e}")
             return None
     
-    def create_general_pdf(self, analysis: Dict, output_path: Path, plot_paths: List[Path], 
+    def create_general_pdf(self, analysis: Dict, output_path: Path, charts: List[RenderedChart], 
                           all_data: pd.DataFrame, data_files: List[Path]):
         """Create general report PDF - ALWAYS OVERWRITES THE SAME FILE."""
         # Fixed name for general report (overwrites each time)
@@ -429,9 +752,9 @@ class PDFReportGenerator:
         # 2. Daily analysis
         story.append(Paragraph("2. ANALISI DETTAGLIATA PER GIORNO", self.styles['SectionTitle']))
         
-        if 'date' in all_data.columns:
+        if 'epoch_day' in all_data.columns:
             # Raggruppa dati per giorno
-            daily_summary = all_data.groupby('date').agg({
+            daily_summary = all_data.groupby('epoch_day').agg({
                 'total_act_energy': 'sum',
                 'max_act_power': ['max', 'mean'],
                 'avg_voltage': 'mean',
@@ -440,6 +763,7 @@ class PDFReportGenerator:
             
             daily_summary.columns = ['energia_kwh', 'potenza_max', 'potenza_media', 'tensione_media', 'corrente_media']
             daily_summary['energia_kwh'] = daily_summary['energia_kwh'] / 1000
+            daily_summary = daily_summary.rename(index=day_to_date)
             
             # Create daily summary table
             story.append(Paragraph("Riepilogo Consumi Giornalieri", self.styles['SubTitle']))
@@ -487,15 +811,10 @@ class PDFReportGenerator:
         story.append(Paragraph("3. GRAFICI DI SINTESI", self.styles['SectionTitle']))
         
         # Add charts
-        for plot_path in plot_paths:
-            if plot_path.exists():
-                story.append(Paragraph(plot_path.stem.replace('_', ' ').title(), self.styles['SubTitle']))
-                try:
-                    img = Image(str(plot_path), width=6*inch, height=4*inch)
-                    story.append(img)
-                    story.append(Spacer(1, 10))
-                except Exception as e:
-                    story.append(Paragraph(f"Grafico non disponibile: {e}", self.styles['Normal']))
+        for chart in charts:
+            story.append(Paragraph(chart.name.replace('_', ' ').title(), self.styles['SubTitle']))
+            story.append(ChartImage(chart, width=6*inch, height=4*inch))
+            story.append(Spacer(1, 10))
         
         story.append(PageBreak())
         
@@ -841,24 +1160,65 @@ class PDFReportGenerator:
             return None
 
 
+@lru_cache(maxsize=None)
+def shared_pdf_generator() -> PDFReportGenerator:
+    """One PDFReportGenerator per process; it only holds the (read-only) paragraph styles."""
+    return PDFReportGenerator()
+
+
+def warm_up():
+    """
+    Pay the first-report costs up front: PDF styles, reportlab fonts, the matplotlib font
+    cache and this thread's templates of the device charts. Used by the report workers.
+    """
+    generator = shared_pdf_generator()
+    charts = chart_renderer()
+    hours = np.arange(24)
+    times = pd.date_range('2024-01-01', periods=24, freq='h')
+    chart = charts.line('warm-up', times, hours, 'warm-up', '', '', date_format='%d/%m %H:%M', rotation=45)
+    charts.bars('warm-up', hours, hours, 'warm-up', '', '', ticks=hours, tick_labels=[str(h) for h in hours])
+    charts.bars('warm-up', hours, hours, 'warm-up', '', '', figsize=(10, 6), ticks=range(0, 24, 2))
+    SimpleDocTemplate(io.BytesIO(), pagesize=A4).build([
+        Paragraph('warm-up', generator.styles['MainTitle']),
+        ChartImage(chart, width=4 * cm, height=2 * cm),
+    ])
+
+
 class ShellyEnergyReport:
     def __init__(
         self, 
         data_dir: str = "data",
         output_dir: str = "reports",
         encoding: str = "utf-8",
-        correct_timestamps: bool = True
+        correct_timestamps: bool = True,
+        workers: int = 1,
+        executor=None,
+        save_charts: bool = False
     ):
         """
         Shelly EM data analyzer with PDF reports.
+        
+        Device reports are built on a pool of `workers` processes (0 = one per core, up to
+        MAX_AUTO_WORKERS); with 1 they are built in this process. An executor (e.g. a warm
+        ReportWorkerPool) takes the device reports instead of a pool created per run.
+        Charts are embedded in the PDFs from memory; save_charts also writes them as PNGs
+        into the grafici/ folders.
         """
         self.data_dir = Path(data_dir)
         self.output_dir = Path(output_dir)
         self.encoding = encoding
         self.correct_timestamps = correct_timestamps
+        self.workers = workers
+        self.executor = executor
+        self.save_charts = save_charts
         self.data_files = []
         self.all_data = None
-        self.pdf_generator = PDFReportGenerator()
+        self.device_index: Dict[str, slice] = {}
+        self.fleet_results = None
+        self.analysis_cube = None
+        self.timestamp_offset = 0
+        self.pdf_generator = shared_pdf_generator()
+        self.report_cache = ReportCache(self.output_dir / LOAD_CACHE_DIRNAME / REPORT_CACHE_DIRNAME)
         self.selected_entities = self._load_selected_entities()
     
     def _load_selected_entities(self):
@@ -897,8 +1257,8 @@ class ShellyEnergyReport:
         
     def _find_data_files(self):
         """Find all CSV files in the data folder."""
-        csv_files = list(self.data_dir.glob("*.csv"))
-        csv_files.extend(list(self.data_dir.glob("emdata_*.csv")))
+        # emdata_*.csv exports are already matched by *.csv
+        csv_files = set(self.data_dir.glob("*.csv"))
         
         if not csv_files:
             raise FileNotFoundError(f"Nessun file CSV trovato in {self.data_dir}")
@@ -910,24 +1270,32 @@ class ShellyEnergyReport:
         
         return self.data_files
     
-    def _load_and_correct_csv(self, file_path: Path) -> pd.DataFrame:
-        """Load and correct a CSV file."""
-        print(f"[INFO] Loading: {file_path.name}")
+    def _load_and_correct_csv(self, file_path: Path, cache: LoadCache = None, entity_ids=None,
+                              start=None, end=None) -> pd.DataFrame:
+        """
+        Load and correct a CSV file, keeping only rows of the given entities and [start, end) window.
         
-        try:
-            df = pd.read_csv(file_path, encoding=self.encoding)
-        except UnicodeDecodeError:
-            for enc in ['latin-1', 'iso-8859-1', 'cp1252']:
-                try:
-                    df = pd.read_csv(file_path, encoding=enc)
-                    self.encoding = enc
-                    print(f"    - Encoding detected: {enc}")
-                    break
-                except:
-                    continue
-            else:
-                raise ValueError(f"Impossibile leggere il file {file_path.name}")
+        A fingerprint-matching cache sidecar is memory-mapped and filtered instead of parsing the file;
+        on a miss the parsed blocks are written to the cache.
+        """
+        cached = cache.get(file_path) if cache is not None else None
+        if cached is not None:
+            print(f"[INFO] Loading: {file_path.name} (cached)")
+            table = encode_categories(filter_rows(cached, entity_ids, start, end))
+        else:
+            print(f"[INFO] Loading: {file_path.name}")
+            try:
+                table, encoding = read_report_csv(
+                    file_path, self.encoding, entity_ids=entity_ids, start=start, end=end, cache=cache
+                )
+            except (pa.ArrowInvalid, UnicodeDecodeError) as e:
+                raise ValueError(f"Impossibile leggere il file {file_path.name}: {e}")
+            
+            if encoding != self.encoding:
+                self.encoding = encoding
+                print(f"    - Encoding detected: {encoding}")
         
+        df = table.to_pandas()
         df['source_file'] = file_path.name
         
         if 'timestamp' not in df.columns:
@@ -938,26 +1306,32 @@ class ShellyEnergyReport:
     
     def _correct_timestamps_in_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """Correct erroneous timestamps."""
+        self.timestamp_offset = 0
         if not self.correct_timestamps or 'timestamp' not in df.columns:
             return df
         
-        df['datetime_raw'] = pd.to_datetime(df['timestamp'], unit='s')
-        latest_timestamp_raw = df['datetime_raw'].max()
+        latest_timestamp_raw = pd.to_datetime(df['timestamp'].max(), unit='s')
         current_time = datetime.now()
         time_diff = current_time - latest_timestamp_raw
         
         if abs(time_diff.days) > 30:
             print(f"    [INFO] Timestamp correction: {abs(time_diff.days)} days difference")
             correction_seconds = time_diff.total_seconds()
-            df['timestamp_corrected'] = df['timestamp'] + correction_seconds
-            df['datetime'] = pd.to_datetime(df['timestamp_corrected'], unit='s')
+            df['datetime'] = pd.to_datetime(df['timestamp'] + correction_seconds, unit='s')
+            self.timestamp_offset = correction_seconds
         else:
-            df['datetime'] = df['datetime_raw']
+            df['datetime'] = pd.to_datetime(df['timestamp'], unit='s')
         
         return df
     
     def _prepare_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Prepare the DataFrame with additional metrics."""
+        """
+        Prepare the compact analysis frame.
+        
+        Rows keep datetime, float32 measurements and categorical names; the calendar is
+        reduced to int32 epoch_day plus int8 hour and weekday codes (dates are derived
+        on demand with day_to_date). Raw timestamp columns are dropped.
+        """
         if df is None or len(df) == 0:
             return df
         
@@ -967,229 +1341,380 @@ class ShellyEnergyReport:
             start_time = datetime.now() - timedelta(hours=len(df)/60)
             df['datetime'] = pd.date_range(start=start_time, periods=len(df), freq='1min')
         
-        df['date'] = df['datetime'].dt.date
-        df['hour'] = df['datetime'].dt.hour
-        df['day'] = df['datetime'].dt.day
-        df['month'] = df['datetime'].dt.month
-        df['year'] = df['datetime'].dt.year
-        df['weekday'] = df['datetime'].dt.weekday
-        
-        if 'total_act_energy' in df.columns:
-            df['energy_kwh'] = df['total_act_energy'] / 1000
+        seconds = df['datetime'].values.astype('datetime64[s]').astype(np.int64)
+        epoch_day = seconds // SECONDS_PER_DAY
+        df['epoch_day'] = epoch_day.astype(np.int32)
+        df['hour'] = (seconds % SECONDS_PER_DAY // 3600).astype(np.int8)
+        df['weekday'] = ((epoch_day + 3) % 7).astype(np.int8)  # 1970-01-01 was a Thursday
+        df = df.drop(columns=['timestamp'], errors='ignore')
         
-        if all(col in df.columns for col in ['total_act_energy', 'lag_react_energy']):
-            df['power_factor_est'] = df['total_act_energy'] / np.sqrt(
-                df['total_act_energy']**2 + df['lag_react_energy']**2 + 1e-6
-            )
+        for col in MEASUREMENT_COLUMNS:
+            if col in df.columns and df[col].dtype != np.float32:
+                df[col] = df[col].astype(np.float32)
         
+        return self._categorize(df)
+    
+    @staticmethod
+    def _categorize(df: pd.DataFrame) -> pd.DataFrame:
+        """Store repeated strings as categoricals (again after concatenating frames)."""
+        for col in CATEGORY_COLUMNS + ('source_file',):
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
         return df
     
-    def _analyze_consumption_patterns(self, df: pd.DataFrame) -> Dict:
+    def _combined_results(self, df: pd.DataFrame) -> pd.Series:
+        """Analysis results of all rows of df taken together."""
+        if len(df) == 0:
+            return pd.Series(dtype=object)
+        results = analyze_fleet(df, per_entity=False)
+        return results.iloc[0] if len(results) else pd.Series(dtype=object)
+    
+    def _device_results(self, device_id: str, device_data: pd.DataFrame) -> pd.Series:
+        """Row of the fleet results table for one device (computed on the spot if missing)."""
+        if self.fleet_results is not None and device_id in self.fleet_results.index:
+            return self.fleet_results.loc[device_id]
+        return self._combined_results(device_data)
+    
+    def _analyze_consumption_patterns(self, df: pd.DataFrame, results: pd.Series = None) -> Dict:
         """Analisi avanzata dei pattern di consumo."""
         analysis = {}
+        results = self._combined_results(df) if results is None else results
         
-        if len(df) == 0 or 'max_act_power' not in df.columns:
+        if results.empty or 'peak_hour' not in results.index:
             return analysis
         
         # Analisi fasce orarie
-        if 'hour' in df.columns:
-            hourly_avg = df.groupby('hour')['max_act_power'].mean()
-            analysis['peak_hour'] = int(hourly_avg.idxmax())
-            analysis['lowest_hour'] = int(hourly_avg.idxmin())
-            analysis['peak_hour_power'] = float(hourly_avg.max())
-            analysis['lowest_hour_power'] = float(hourly_avg.min())
-            
-            # Fasce orarie (notte, mattina, pomeriggio, sera)
-            night_mask = (df['hour'] >= 0) & (df['hour'] < 6)
-            morning_mask = (df['hour'] >= 6) & (df['hour'] < 12)
-            afternoon_mask = (df['hour'] >= 12) & (df['hour'] < 18)
-            evening_mask = (df['hour'] >= 18) & (df['hour'] < 24)
-            
-            analysis['time_bands'] = {
-                'night': {
-                    'avg_power': float(df[night_mask]['max_act_power'].mean()) if night_mask.any() else 0,
-                    'total_energy': float(df[night_mask]['total_act_energy'].sum() / 1000) if night_mask.any() else 0,
-                    'percentage': float((df[night_mask]['total_act_energy'].sum() / df['total_act_energy'].sum() * 100)) if night_mask.any() else 0
-                },
-                'morning': {
-                    'avg_power': float(df[morning_mask]['max_act_power'].mean()) if morning_mask.any() else 0,
-                    'total_energy': float(df[morning_mask]['total_act_energy'].sum() / 1000) if morning_mask.any() else 0,
-                    'percentage': float((df[morning_mask]['total_act_energy'].sum() / df['total_act_energy'].sum() * 100)) if morning_mask.any() else 0
-                },
-                'afternoon': {
-                    'avg_power': float(df[afternoon_mask]['max_act_power'].mean()) if afternoon_mask.any() else 0,
-                    'total_energy': float(df[afternoon_mask]['total_act_energy'].sum() / 1000) if afternoon_mask.any() else 0,
-                    'percentage': float((df[afternoon_mask]['total_act_energy'].sum() / df['total_act_energy'].sum() * 100)) if afternoon_mask.any() else 0
-                },
-                'evening': {
-                    'avg_power': float(df[evening_mask]['max_act_power'].mean()) if evening_mask.any() else 0,
-                    'total_energy': float(df[evening_mask]['total_act_energy'].sum() / 1000) if evening_mask.any() else 0,
-                    'percentage': float((df[evening_mask]['total_act_energy'].sum() / df['total_act_energy'].sum() * 100)) if evening_mask.any() else 0
+        if results['peak_hour'] >= 0:
+            analysis['peak_hour'] = int(results['peak_hour'])
+            analysis['lowest_hour'] = int(results['lowest_hour'])
+            analysis['peak_hour_power'] = float(results['peak_hour_power'])
+            analysis['lowest_hour_power'] = float(results['lowest_hour_power'])
+        
+        # Fasce orarie (notte, mattina, pomeriggio, sera)
+        analysis['time_bands'] = {}
+        for band in TIME_BANDS:
+            if results[f'{band}_rows'] > 0:
+                analysis['time_bands'][band] = {
+                    'avg_power': float(results[f'{band}_avg_power']),
+                    'total_energy': float(results.get(f'{band}_total_energy', 0)),
+                    'percentage': float(results.get(f'{band}_percentage', 0))
                 }
-            }
+            else:
+                analysis['time_bands'][band] = {'avg_power': 0, 'total_energy': 0, 'percentage': 0}
         
         # Analisi weekend vs feriali
-        if 'weekday' in df.columns:
-            weekend_mask = df['weekday'].isin([5, 6])
-            weekday_mask = ~weekend_mask
-            
-            if weekday_mask.any() and weekend_mask.any():
-                analysis['weekday_vs_weekend'] = {
-                    'weekday_avg': float(df[weekday_mask].groupby('date')['total_act_energy'].sum().mean() / 1000),
-                    'weekend_avg': float(df[weekend_mask].groupby('date')['total_act_energy'].sum().mean() / 1000),
-                    'difference_pct': float(((df[weekend_mask].groupby('date')['total_act_energy'].sum().mean() - 
-                                              df[weekday_mask].groupby('date')['total_act_energy'].sum().mean()) /
-                                             df[weekday_mask].groupby('date')['total_act_energy'].sum().mean() * 100))
-                }
+        if pd.notna(results.get('weekday_avg')) and pd.notna(results.get('weekend_avg')):
+            analysis['weekday_vs_weekend'] = {
+                'weekday_avg': float(results['weekday_avg']),
+                'weekend_avg': float(results['weekend_avg']),
+                'difference_pct': _ratio((results['weekend_avg'] - results['weekday_avg']) * 100, results['weekday_avg'])
+            }
         
         return analysis
     
-    def _detect_anomalies(self, df: pd.DataFrame) -> Dict:
+    def _detect_anomalies(self, df: pd.DataFrame, results: pd.Series = None) -> Dict:
         """Rilevamento anomalie e picchi."""
         anomalies = {}
+        results = self._combined_results(df) if results is None else results
         
-        if len(df) == 0 or 'max_act_power' not in df.columns:
+        if results.empty or not isinstance(results.get('top_peaks'), list):
             return anomalies
         
         # Picco massimo assoluto
-        max_power_idx = df['max_act_power'].idxmax()
+        peaks = results['top_peaks']
         anomalies['absolute_peak'] = {
-            'value': float(df.loc[max_power_idx, 'max_act_power']),
-            'timestamp': str(df.loc[max_power_idx, 'datetime']) if 'datetime' in df.columns else 'N/A',
-            'date': str(df.loc[max_power_idx, 'date']) if 'date' in df.columns else 'N/A'
+            'value': float(peaks[0]['max_act_power']),
+            'timestamp': str(peaks[0]['datetime']) if 'datetime' in peaks[0] else 'N/A',
+            'date': str(day_to_date(peaks[0]['epoch_day'])) if 'epoch_day' in peaks[0] else 'N/A'
         }
         
         # Consumi notturni anomali (00:00-06:00)
-        if 'hour' in df.columns:
-            night_data = df[(df['hour'] >= 0) & (df['hour'] < 6)]
-            if len(night_data) > 0:
-                night_avg = night_data['max_act_power'].mean()
-                day_avg = df[(df['hour'] >= 6) & (df['hour'] < 22)]['max_act_power'].mean()
-                
-                if night_avg > day_avg * 0.3:  # Se consumo notturno > 30% del giorno
-                    anomalies['high_night_consumption'] = {
-                        'night_avg': float(night_avg),
-                        'day_avg': float(day_avg),
-                        'night_percentage': float((night_avg / day_avg * 100))
-                    }
+        if results['night_rows'] > 0:
+            night_avg = float(results['night_avg'])
+            day_avg = float(results['day_avg'])
+            
+            if night_avg > day_avg * 0.3:  # Se consumo notturno > 30% del giorno
+                anomalies['high_night_consumption'] = {
+                    'night_avg': night_avg,
+                    'day_avg': day_avg,
+                    'night_percentage': _ratio(night_avg * 100, day_avg)
+                }
         
         # Top 5 picchi
-        top_peaks = df.nlargest(5, 'max_act_power')[['datetime', 'max_act_power']] if 'datetime' in df.columns else pd.DataFrame()
-        if not top_peaks.empty:
+        if 'datetime' in peaks[0]:
             anomalies['top_5_peaks'] = [
-                {'timestamp': str(row['datetime']), 'power': float(row['max_act_power'])} 
-                for _, row in top_peaks.iterrows()
+                {'timestamp': str(peak['datetime']), 'power': float(peak['max_act_power'])}
+                for peak in peaks
             ]
         
         return anomalies
     
-    def _calculate_environmental_impact(self, df: pd.DataFrame) -> Dict:
+    def _calculate_environmental_impact(self, df: pd.DataFrame, results: pd.Series = None) -> Dict:
         """Calcolo impatto ambientale."""
         impact = {}
+        results = self._combined_results(df) if results is None else results
         
-        if len(df) == 0 or 'total_act_energy' not in df.columns:
+        if results.empty or 'co2_kg' not in results.index:
             return impact
         
-        total_kwh = df['total_act_energy'].sum() / 1000
-        
-        # CO2 emessa (media Italia: 0.233 kg CO2/kWh)
-        co2_factor = 0.233
-        co2_kg = total_kwh * co2_factor
+        # CO2 emessa, alberi necessari per compensare, equivalente km in auto
+        co2_kg = results['co2_kg']
         impact['co2_kg'] = round(co2_kg, 2)
-        
-        # Alberi necessari per compensare (1 albero assorbe ~22 kg CO2/anno)
-        trees_per_year = co2_kg / 22
-        impact['trees_needed'] = round(trees_per_year, 2)
-        
-        # Equivalente km in auto (media: 0.12 kg CO2/km)
-        km_equivalent = co2_kg / 0.12
-        impact['km_car_equivalent'] = round(km_equivalent, 0)
+        impact['trees_needed'] = round(co2_kg / CO2_KG_PER_TREE_YEAR, 2)
+        impact['km_car_equivalent'] = round(co2_kg / CO2_KG_PER_CAR_KM, 0)
         
         return impact
     
-    def _generate_predictions(self, df: pd.DataFrame) -> Dict:
+    def _generate_predictions(self, df: pd.DataFrame, results: pd.Series = None) -> Dict:
         """Generazione previsioni consumo."""
         predictions = {}
+        results = self._combined_results(df) if results is None else results
         
-        if len(df) == 0 or 'date' not in df.columns or 'total_act_energy' not in df.columns:
+        if results.empty or results.get('days', 0) < 3:
             return predictions
         
-        # Consumo giornaliero
-        daily_consumption = df.groupby('date')['total_act_energy'].sum() / 1000
-        
-        if len(daily_consumption) < 3:
-            return predictions
-        
-        # Media ultimi 7 giorni
-        last_7_days = daily_consumption.tail(7).mean()
+        # Media ultimi 7 giorni e proiezione mensile
+        last_7_days = results['last_7_avg']
         predictions['avg_daily_last_7_days'] = round(last_7_days, 2)
-        
-        # Proiezione mensile
         predictions['projected_monthly'] = round(last_7_days * 30, 2)
         
         # Trend (ultimi 7 giorni vs 7 precedenti)
-        if len(daily_consumption) >= 14:
-            last_week = daily_consumption.tail(7).mean()
-            previous_week = daily_consumption.tail(14).head(7).mean()
-            trend_pct = ((last_week - previous_week) / previous_week * 100)
+        if results['days'] >= 14:
+            trend_pct = ((last_7_days - results['previous_7_avg']) / results['previous_7_avg'] * 100)
             predictions['trend'] = {
                 'direction': 'aumento' if trend_pct > 0 else 'diminuzione',
                 'percentage': round(abs(trend_pct), 1)
             }
         
         # Giorni migliori (minor consumo)
-        if len(daily_consumption) >= 3:
-            best_days_idx = daily_consumption.nsmallest(3).index
-            predictions['best_days'] = [str(d) for d in best_days_idx]
-            predictions['best_days_avg'] = round(daily_consumption.nsmallest(3).mean(), 2)
+        predictions['best_days'] = [str(d) for d in results['best_days']]
+        predictions['best_days_avg'] = round(results['best_days_avg'], 2)
         
         return predictions
     
-    def _analyze_power_quality(self, df: pd.DataFrame) -> Dict:
+    def _analyze_power_quality(self, df: pd.DataFrame, results: pd.Series = None) -> Dict:
         """Analisi qualità della rete elettrica."""
         quality = {}
+        results = self._combined_results(df) if results is None else results
         
-        if len(df) == 0:
+        if results.empty:
             return quality
         
-        # Analisi tensione
-        if 'avg_voltage' in df.columns:
+        # Analisi tensione (% stabilità dentro range 220-240V)
+        if 'voltage_avg' in results.index:
             quality['voltage'] = {
-                'min': round(df['avg_voltage'].min(), 1),
-                'max': round(df['avg_voltage'].max(), 1),
-                'avg': round(df['avg_voltage'].mean(), 1),
-                'std': round(df['avg_voltage'].std(), 2)
+                'min': round(results['voltage_min'], 1),
+                'max': round(results['voltage_max'], 1),
+                'avg': round(results['voltage_avg'], 1),
+                'std': round(results['voltage_std'], 2),
+                'stability_pct': round(results['voltage_stability_pct'], 1)
+            }
+        
+        # Fattore di potenza (stimato da energia attiva e reattiva)
+        if results.get('pf_count', 0) > 0:
+            quality['power_factor'] = {
+                'min': round(results['pf_min'], 3),
+                'max': round(results['pf_max'], 3),
+                'avg': round(results['pf_avg'], 3)
             }
-            
-            # Stabilità tensione (% dentro range 220-240V)
-            stable_voltage = df[(df['avg_voltage'] >= 220) & (df['avg_voltage'] <= 240)]
-            stability_pct = (len(stable_voltage) / len(df) * 100)
-            quality['voltage']['stability_pct'] = round(stability_pct, 1)
-        
-        # Fattore di potenza
-        if 'power_factor_est' in df.columns:
-            pf_data = df[df['power_factor_est'].notna()]
-            if len(pf_data) > 0:
-                quality['power_factor'] = {
-                    'min': round(pf_data['power_factor_est'].min(), 3),
-                    'max': round(pf_data['power_factor_est'].max(), 3),
-                    'avg': round(pf_data['power_factor_est'].mean(), 3)
-                }
         
         return quality
     
-    def load_all_data(self) -> pd.DataFrame:
-        """Load and combine all data."""
+    def _load_data_source(self) -> str:
+        """Return the store table written by the last collection (samples or statistics)."""
+        state_file = self.data_dir / "collect_state.json"
+        if state_file.exists():
+            try:
+                with open(state_file, 'r') as f:
+                    source = json.load(f).get('source', 'samples')
+                if source in EXPANDERS:
+                    return source
+            except Exception as e:
+                print(f"[WARN] Could not load collection state: {e}")
+        return 'samples'
+    
+    def _load_storage_retention(self) -> dict:
+        """Return the per-tier retention in days (0 = forever) from the storage configuration."""
+        config_file = self.data_dir / "storage_config.json"
+        if config_file.exists():
+            try:
+                with open(config_file, 'r') as f:
+                    return tier_retention(json.load(f))
+            except Exception as e:
+                print(f"[WARN] Could not load storage config: {e}")
+        return tier_retention({})
+    
+    def _choose_store_tier(self, store: EnergyDataStore, entity_ids=None, start=None, end=None) -> str:
+        """
+        Pick the store tier for [start, end): raw samples, unless retention has dropped them for
+        part of the window; then the coarsest rollup that still gives about CHART_POINTS points.
+        """
+        built = store.ensure_rollups(entity_ids)
+        if built:
+            print(f"[INFO] Rollups built for {built} entity-days")
+        now = datetime.now().timestamp()
+        if start is None:
+            first_day = store.first_day(entity_ids)
+            start = first_day * SECONDS_PER_DAY if first_day is not None else now
+        resolution = ((end if end is not None else now) - start) / CHART_POINTS
+        tier = store.choose_tier(start, resolution, self._load_storage_retention(), entity_ids=entity_ids)
+        print(f"[INFO] Storage tier: {tier} (~{resolution:.0f}s per chart point)")
+        return tier
+    
+    def _load_store_data(self, store: EnergyDataStore, table: str = "samples", entity_ids=None,
+                         start=None, end=None) -> pd.DataFrame:
+        """Load collected rows from the Parquet store, filtered while scanning."""
+        print(f"[INFO] Loading Parquet store: {store.root} ({table})")
+        df = EXPANDERS[table](store.read(table, entity_ids, start=start, end=end)).to_pandas()
+        df['source_file'] = table
+        return df
+    
+    @staticmethod
+    def _window_mask(datetimes: pd.Series, start=None, end=None) -> pd.Series:
+        """Mask of naive UTC datetimes inside [start, end) (datetimes or epoch seconds)."""
+        mask = pd.Series(True, index=datetimes.index)
+        if start is not None:
+            start = start.timestamp() if isinstance(start, datetime) else start
+            mask &= datetimes >= pd.to_datetime(start, unit='s')
+        if end is not None:
+            end = end.timestamp() if isinstance(end, datetime) else end
+            mask &= datetimes < pd.to_datetime(end, unit='s')
+        return mask
+    
+    def _index_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Sort rows by (entity_id, datetime) and index each entity's contiguous row slice.
+        
+        device_index maps entity_id -> slice, so per-device and per-day selections are
+        positional slices of all_data instead of boolean scans.
+        """
+        self.device_index = {}
+        self.fleet_results = None
+        self.analysis_cube = None
+        if 'datetime' not in df.columns:
+            return df
+        if 'entity_id' not in df.columns:
+            return df.sort_values('datetime', ignore_index=True)
+        
+        df = df.sort_values(['entity_id', 'datetime'], ignore_index=True)
+        codes = df['entity_id'].cat.codes.to_numpy()
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(codes)) + 1, [len(codes)]))
+        categories = df['entity_id'].cat.categories
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            if codes[start] >= 0:
+                self.device_index[str(categories[codes[start]])] = slice(int(start), int(stop))
+        return df
+    
+    def device_rows(self, device_id: str) -> pd.DataFrame:
+        """Rows of one device as a positional slice of all_data."""
+        rows = self.device_index.get(device_id)
+        if rows is None:
+            return self.all_data.iloc[0:0]
+        return self.all_data.iloc[rows]
+    
+    def _day_positions(self, epoch_day: int, device_id: str = None) -> np.ndarray:
+        """Row positions of one day, found by binary search inside each device slice."""
+        days = self.all_data['epoch_day'].to_numpy()
+        slices = [self.device_index[device_id]] if device_id is not None else self.device_index.values()
+        ranges = []
+        for rows in slices:
+            device_days = days[rows]
+            lo, hi = np.searchsorted(device_days, [epoch_day, epoch_day + 1])
+            ranges.append(np.arange(rows.start + lo, rows.start + hi))
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+    
+    def _analysis_cube(self) -> pd.DataFrame:
+        """Hourly cube of all_data: the persisted rollup when loaded from the store, else built from the rows."""
+        if self.analysis_cube is None:
+            self.analysis_cube = build_analysis_cube(self.all_data)
+        return self.analysis_cube
+    
+    def _device_cube(self, device_id: str) -> pd.DataFrame:
+        cube = self._analysis_cube()
+        if cube.empty or 'entity_id' not in cube.columns:
+            return cube
+        return cube[cube['entity_id'] == device_id]
+    
+    def _load_rollup_cube(self, store: EnergyDataStore, entity_ids=None, start=None, end=None) -> pd.DataFrame:
+        """Read the hourly rollup of the loaded samples."""
+        return cube_from_rollup(store.read("hourly", entity_ids, start=start, end=end))
+    
+    def _set_columnar_data(self, df: pd.DataFrame, origin: str) -> pd.DataFrame:
+        """Finish loading rows that come from the store or from memory as a single frame."""
+        df = self._correct_timestamps_in_data(df)
+        self.all_data = self._index_rows(self._prepare_dataframe(df))
+        print(f"\n[INFO] Data: {len(self.all_data)} rows from {origin}")
+        print(f"[INFO] Period: {self.all_data['datetime'].min()} - {self.all_data['datetime'].max()}")
+        print(f"[INFO] Unique days: {self.all_data['epoch_day'].nunique()}")
+        return self.all_data
+    
+    def load_data(self, data, entity_ids=None, start=None, end=None) -> pd.DataFrame:
+        """
+        Use an already-built DataFrame or Arrow table as the data source, skipping files.
+        
+        Accepts store samples/statistics tables (converted to report columns) or frames that
+        already have the report columns (total_act_energy, max_act_power, ...).
+        Rows outside the given entities and [start, end) window are dropped before conversion.
+        """
+        print("\n[INFO] Loading in-memory data...")
+        if isinstance(data, pd.DataFrame):
+            data = pa.Table.from_pandas(data, preserve_index=False)
+        df = expand_table(filter_rows(data, entity_ids, start, end)).to_pandas()
+        df['source_file'] = 'memory'
+        return self._set_columnar_data(df, "memory")
+    
+    def load_all_data(self, entity_ids=None, start=None, end=None) -> pd.DataFrame:
+        """
+        Load and combine all data.
+        
+        Only rows of entity_ids (default: the selected entities, or all when none are selected) inside [start, end) are loaded;
+        start/end are datetimes or epoch seconds. The filters are pushed into the store scan or
+        the CSV reader. When timestamp correction is enabled, CSV rows are windowed after the
+        correction, since the raw timestamps of such files cannot be trusted.
+        Store samples are windowed on whole hours and read raw; only when retention has dropped
+        raw samples inside the window, from the coarsest rollup tier (1-minute, 15-minute,
+        hourly or daily buckets) that still resolves it;
+        unless only daily buckets remain, the aggregate analysis and charts read the hourly
+        rollup instead of regrouping the rows.
+        """
         print("\n[INFO] Loading and combining all data...")
         
+        if entity_ids is None:
+            entity_ids = self.selected_entities or None
+        
+        store = EnergyDataStore(self.data_dir)
+        table = self._load_data_source()
+        if store.has_data(table):
+            samples = table == "samples"
+            if samples:
+                # Whole hours, so the rows match the hourly rollup buckets
+                start, end = _hour_bound(start), _hour_bound(end, ceil=True)
+                table = self._choose_store_tier(store, entity_ids, start, end)
+            self.data_files = store.files(table)
+            df = self._load_store_data(store, table, entity_ids, start, end)
+            self._set_columnar_data(df, f"{len(self.data_files)} partitions")
+            if samples and table != "daily" and not self.timestamp_offset:
+                try:
+                    self.analysis_cube = self._load_rollup_cube(store, entity_ids, start, end)
+                except Exception as e:
+                    print(f"[WARN] Rollups not available, aggregating rows: {e}")
+            return self.all_data
+        
         self._find_data_files()
         
+        cache = LoadCache(self.data_dir / LOAD_CACHE_DIRNAME)
+        window_after_correction = self.correct_timestamps and (start is not None or end is not None)
         all_dfs = []
         for file_path in self.data_files:
             try:
-                df = self._load_and_correct_csv(file_path)
+                if window_after_correction:
+                    df = self._load_and_correct_csv(file_path, cache, entity_ids)
+                else:
+                    df = self._load_and_correct_csv(file_path, cache, entity_ids, start, end)
                 df = self._correct_timestamps_in_data(df)
                 df = self._prepare_dataframe(df)
+                if window_after_correction:
+                    df = df[self._window_mask(df['datetime'], start, end)]
                 all_dfs.append(df)
                 print(f"[INFO] {file_path.name}: {len(df)} rows")
             except Exception as e:
@@ -1199,15 +1724,12 @@ class ShellyEnergyReport:
         if not all_dfs:
             raise ValueError("No valid data found")
         
-        self.all_data = pd.concat(all_dfs, ignore_index=True, sort=False)
-        
-        if 'datetime' in self.all_data.columns:
-            self.all_data = self.all_data.sort_values('datetime')
+        self.all_data = self._index_rows(self._categorize(pd.concat(all_dfs, ignore_index=True, sort=False)))
         
         print(f"\n[INFO] Combined data: {len(self.all_data)} total rows")
         if 'datetime' in self.all_data.columns:
             print(f"[INFO] Period: {self.all_data['datetime'].min()} - {self.all_data['datetime'].max()}")
-            print(f"[INFO] Unique days: {self.all_data['date'].nunique()}")
+            print(f"[INFO] Unique days: {self.all_data['epoch_day'].nunique()}")
         
         return self.all_data
     
@@ -1226,20 +1748,24 @@ class ShellyEnergyReport:
     
     def _analyze_daily_data(self, date: datetime.date) -> Dict:
         """Analyze data for a single day."""
-        day_data = self.all_data[self.all_data['date'] == date]
+        if self.device_index:
+            day_data = self.all_data.iloc[self._day_positions(date_to_day(date))]
+        else:
+            day_data = self.all_data[self.all_data['epoch_day'] == date_to_day(date)]
         
         if len(day_data) == 0:
             return {}
         
+        power = _power_summary(day_data)
         analysis = {
             'date': date.strftime('%Y-%m-%d'),
             'total_energy_kwh': day_data['total_act_energy'].sum() / 1000 if 'total_act_energy' in day_data.columns else 0,
-            'avg_power_w': day_data['max_act_power'].mean() if 'max_act_power' in day_data.columns else 0,
-            'max_power_w': day_data['max_act_power'].max() if 'max_act_power' in day_data.columns else 0,
+            'avg_power_w': power.get('avg_power_w', 0),
+            'max_power_w': power.get('max_power_w', 0),
             'min_power_w': day_data['min_act_power'].min() if 'min_act_power' in day_data.columns else 0,
             'avg_voltage': day_data['avg_voltage'].mean() if 'avg_voltage' in day_data.columns else 0,
             'avg_current': day_data['avg_current'].mean() if 'avg_current' in day_data.columns else 0,
-            'data_points': len(day_data)
+            'data_points': power['data_points']
         }
         
         if 'max_act_power' in day_data.columns:
@@ -1254,71 +1780,58 @@ class ShellyEnergyReport:
         
         return analysis
     
-    def _create_daily_plots(self, day_data: pd.DataFrame, date: datetime.date, output_dir: Path) -> List[Path]:
-        """Create charts for a single day and return the paths."""
-        plot_paths = []
+    def _create_daily_plots(self, day_data: pd.DataFrame, date: datetime.date) -> List[RenderedChart]:
+        """Create charts for a single day."""
+        plot_charts = []
         
         if len(day_data) == 0:
-            return plot_paths
+            return plot_charts
+        
+        charts = chart_renderer()
+        day_label = date.strftime("%d/%m/%Y")
         
         # 1. Power trend
-        fig1, ax1 = plt.subplots(figsize=(12, 6))
         if 'datetime' in day_data.columns and 'max_act_power' in day_data.columns:
-            ax1.plot(day_data['datetime'], day_data['max_act_power'], 'b-', linewidth=1.5, alpha=0.8)
-            ax1.set_title(f'Andamento Potenza - {date.strftime("%d/%m/%Y")}', fontsize=14, fontweight='bold')
-            ax1.set_xlabel('Ora del Giorno', fontsize=12)
-            ax1.set_ylabel('Potenza (W)', fontsize=12)
-            ax1.grid(True, alpha=0.3)
-            ax1.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-            plt.tight_layout()
-            plot_path = output_dir / f"potenza_{date.strftime('%Y%m%d')}.png"
-            plt.savefig(plot_path, dpi=150, bbox_inches='tight')
-            plot_paths.append(plot_path)
-            plt.close()
+            plot_charts.append(charts.line(
+                f"potenza_{date.strftime('%Y%m%d')}",
+                day_data['datetime'], day_data['max_act_power'],
+                f'Andamento Potenza - {day_label}', 'Ora del Giorno', 'Potenza (W)',
+                date_format='%H:%M',
+            ))
         
         # 2. Hourly profile
-        fig2, ax2 = plt.subplots(figsize=(10, 6))
         if 'hour' in day_data.columns and 'max_act_power' in day_data.columns:
             hourly_avg = day_data.groupby('hour')['max_act_power'].mean()
-            ax2.bar(hourly_avg.index, hourly_avg.values, alpha=0.7, color='steelblue')
-            ax2.set_title(f'Profilo Orario Consumi - {date.strftime("%d/%m/%Y")}', fontsize=14)
-            ax2.set_xlabel('Ora del Giorno', fontsize=12)
-            ax2.set_ylabel('Potenza Media (W)', fontsize=12)
-            ax2.set_xticks(range(0, 24, 2))
-            ax2.grid(True, alpha=0.3, axis='y')
-            plt.tight_layout()
-            plot_path = output_dir / f"profilo_orario_{date.strftime('%Y%m%d')}.png"
-            plt.savefig(plot_path, dpi=150, bbox_inches='tight')
-            plot_paths.append(plot_path)
-            plt.close()
+            plot_charts.append(charts.bars(
+                f"profilo_orario_{date.strftime('%Y%m%d')}",
+                hourly_avg.index, hourly_avg.values,
+                f'Profilo Orario Consumi - {day_label}', 'Ora del Giorno', 'Potenza Media (W)',
+                figsize=(10, 6), ticks=range(0, 24, 2), bold=False,
+            ))
         
         # 3. Power distribution
-        fig3, ax3 = plt.subplots(figsize=(10, 6))
         if 'max_act_power' in day_data.columns:
-            ax3.hist(day_data['max_act_power'], bins=30, edgecolor='black', alpha=0.7, color='steelblue')
-            mean_power = day_data['max_act_power'].mean()
-            ax3.axvline(mean_power, color='red', linestyle='--', label=f'Media: {mean_power:.1f} W')
-            ax3.set_title(f'Distribuzione Potenza - {date.strftime("%d/%m/%Y")}', fontsize=14)
-            ax3.set_xlabel('Potenza (W)', fontsize=12)
-            ax3.set_ylabel('Frequenza', fontsize=12)
-            ax3.legend()
-            ax3.grid(True, alpha=0.3)
-            plt.tight_layout()
-            plot_path = output_dir / f"distribuzione_{date.strftime('%Y%m%d')}.png"
-            plt.savefig(plot_path, dpi=150, bbox_inches='tight')
-            plot_paths.append(plot_path)
-            plt.close()
-        
-        return plot_paths
+            plot_charts.append(charts.histogram(
+                f"distribuzione_{date.strftime('%Y%m%d')}",
+                day_data['max_act_power'], 30,
+                f'Distribuzione Potenza - {day_label}', 'Potenza (W)', 'Frequenza',
+            ))
+        
+        return plot_charts
+    
+    def _save_charts(self, charts: List[RenderedChart], directory: Path) -> List[Path]:
+        """Write the charts as PNGs into directory if save_charts is set; returns the files."""
+        if not self.save_charts:
+            return []
+        directory.mkdir(exist_ok=True)
+        return [chart.save(directory) for chart in charts]
     
     def _create_daily_report(self, date: datetime.date, analysis: Dict, day_data: pd.DataFrame):
         """Create complete report for a single day."""
         date_dir = self.daily_reports_dir / date.strftime("%Y-%m-%d")
         date_dir.mkdir(exist_ok=True)
         
-        grafici_dir = date_dir / "grafici"
         dati_dir = date_dir / "dati"
-        grafici_dir.mkdir(exist_ok=True)
         dati_dir.mkdir(exist_ok=True)
         
         print(f"[INFO] Creating report for {date.strftime('%d/%m/%Y')}...")
@@ -1327,14 +1840,15 @@ class ShellyEnergyReport:
         day_data.to_csv(dati_dir / "dati_giornalieri.csv", index=False)
         
         # Create charts
-        plot_paths = self._create_daily_plots(day_data, date, grafici_dir)
+        plot_charts = self._create_daily_plots(day_data, date)
+        self._save_charts(plot_charts, date_dir / "grafici")
         
         # Save JSON statistics
         with open(dati_dir / "statistiche.json", 'w', encoding='utf-8') as f:
-            json.dump(analysis, f, indent=2, default=str)
+            json.dump(analysis, f, indent=2, default=_json_default)
         
         # Create PDF
-        pdf_path = self.pdf_generator.create_daily_pdf(analysis, date, date_dir, plot_paths, day_data)
+        pdf_path = self.pdf_generator.create_daily_pdf(analysis, date, date_dir, plot_charts, day_data)
         
         if pdf_path:
             # Also create a text version for reference
@@ -1348,83 +1862,63 @@ class ShellyEnergyReport:
         else:
             print(f"[WARN] PDF report not created for {date.strftime('%d/%m/%Y')}")
     
-    def _create_general_plots(self, plots_dir: Path) -> List[Path]:
+    def _create_general_plots(self) -> List[RenderedChart]:
         """Create charts for the general report."""
-        plot_paths = []
+        plot_charts = []
+        
+        charts = chart_renderer()
         
         # 1. Daily energy
-        if 'date' in self.all_data.columns and 'total_act_energy' in self.all_data.columns:
-            fig1, ax1 = plt.subplots(figsize=(14, 7))
-            daily_energy = self.all_data.groupby('date')['total_act_energy'].sum() / 1000
-            
-            ax1.bar(daily_energy.index.astype(str), daily_energy.values, alpha=0.7, color='steelblue')
-            ax1.set_title('Energia Consumata per Giorno', fontsize=16, fontweight='bold')
-            ax1.set_xlabel('Data', fontsize=12)
-            ax1.set_ylabel('Energia (kWh)', fontsize=12)
-            ax1.tick_params(axis='x', rotation=45)
-            ax1.grid(True, alpha=0.3, axis='y')
-            plt.tight_layout()
-            plot_path = plots_dir / "energia_giornaliera.png"
-            plt.savefig(plot_path, dpi=150, bbox_inches='tight')
-            plot_paths.append(plot_path)
-            plt.close()
+        cube = self._analysis_cube()
+        if 'energy_sum' in cube.columns:
+            daily_energy = (cube.groupby('epoch_day')['energy_sum'].sum() / 1000).rename(index=day_to_date)
+            positions = np.arange(len(daily_energy))
+            plot_charts.append(charts.bars(
+                "energia_giornaliera",
+                positions, daily_energy.values,
+                'Energia Consumata per Giorno', 'Data', 'Energia (kWh)',
+                figsize=(14, 7), ticks=positions, tick_labels=daily_energy.index.astype(str),
+                rotation=45, title_size=16,
+            ))
         
         # 2. Consumption heatmap
-        if all(col in self.all_data.columns for col in ['date', 'hour', 'max_act_power']):
-            fig2, ax2 = plt.subplots(figsize=(12, 8))
-            
-            pivot_data = self.all_data.pivot_table(
-                values='max_act_power',
-                index='hour',
-                columns='date',
-                aggfunc='mean'
-            ).fillna(0)
-            
-            sns.heatmap(pivot_data, cmap='YlOrRd', ax=ax2, cbar_kws={'label': 'Potenza Media (W)'})
-            ax2.set_title('Heatmap Consumi Orari - Storico Completo', fontsize=16, fontweight='bold')
-            ax2.set_xlabel('Data', fontsize=12)
-            ax2.set_ylabel('Ora del Giorno', fontsize=12)
-            plt.tight_layout()
-            plot_path = plots_dir / "heatmap_consumi.png"
-            plt.savefig(plot_path, dpi=150, bbox_inches='tight')
-            plot_paths.append(plot_path)
-            plt.close()
+        if 'power_sum' in cube.columns:
+            cells = cube.groupby(['hour', 'epoch_day'])[['power_sum', 'power_count']].sum()
+            pivot_data = _divide(cells['power_sum'], cells['power_count']).unstack('epoch_day').fillna(0).rename(columns=day_to_date)
+            plot_charts.append(charts.heatmap(
+                "heatmap_consumi",
+                pivot_data.to_numpy(), pivot_data.index, pivot_data.columns,
+                'Heatmap Consumi Orari - Storico Completo', 'Data', 'Ora del Giorno', 'Potenza Media (W)',
+            ))
         
         # 3. Power distribution
         if 'max_act_power' in self.all_data.columns:
-            fig3, ax3 = plt.subplots(figsize=(10, 6))
-            ax3.hist(self.all_data['max_act_power'], bins=50, edgecolor='black', alpha=0.7, color='steelblue')
-            mean_power = self.all_data['max_act_power'].mean()
-            ax3.axvline(mean_power, color='red', linestyle='--', label=f'Media: {mean_power:.1f} W')
-            ax3.set_title('Distribuzione Potenze - Storico Completo', fontsize=16)
-            ax3.set_xlabel('Potenza (W)', fontsize=12)
-            ax3.set_ylabel('Frequenza', fontsize=12)
-            ax3.legend()
-            ax3.grid(True, alpha=0.3)
-            plt.tight_layout()
-            plot_path = plots_dir / "distribuzione_potenze.png"
-            plt.savefig(plot_path, dpi=150, bbox_inches='tight')
-            plot_paths.append(plot_path)
-            plt.close()
-        
-        return plot_paths
+            plot_charts.append(charts.histogram(
+                "distribuzione_potenze",
+                self.all_data['max_act_power'], 50,
+                'Distribuzione Potenze - Storico Completo', 'Potenza (W)', 'Frequenza',
+                title_size=16,
+            ))
+        
+        return plot_charts
     
     def _analyze_general_data(self) -> Dict:
         """Analyze all combined data."""
+        power = _power_summary(self.all_data)
         analysis = {
             'total_energy_kwh': self.all_data['total_act_energy'].sum() / 1000 if 'total_act_energy' in self.all_data.columns else 0,
-            'avg_power_w': self.all_data['max_act_power'].mean() if 'max_act_power' in self.all_data.columns else 0,
-            'max_power_w': self.all_data['max_act_power'].max() if 'max_act_power' in self.all_data.columns else 0,
-            'days_analyzed': self.all_data['date'].nunique() if 'date' in self.all_data.columns else 0,
-            'total_data_points': len(self.all_data),
+            'avg_power_w': power.get('avg_power_w', 0),
+            'max_power_w': power.get('max_power_w', 0),
+            'days_analyzed': self.all_data['epoch_day'].nunique() if 'epoch_day' in self.all_data.columns else 0,
+            'total_data_points': power['data_points'],
             'date_range': {
                 'start': self.all_data['datetime'].min().strftime('%Y-%m-%d') if 'datetime' in self.all_data.columns else 'N/A',
                 'end': self.all_data['datetime'].max().strftime('%Y-%m-%d') if 'datetime' in self.all_data.columns else 'N/A'
             }
         }
         
-        if 'date' in self.all_data.columns and 'total_act_energy' in self.all_data.columns:
-            daily_energy = self.all_data.groupby('date')['total_act_energy'].sum() / 1000
+        if 'epoch_day' in self.all_data.columns and 'total_act_energy' in self.all_data.columns:
+            daily_energy = (self.all_data.groupby('epoch_day')['total_act_energy'].sum() / 1000).rename(index=day_to_date)
             analysis['daily_energy_stats'] = {
                 'max': float(daily_energy.max()),
                 'min': float(daily_energy.min()),
@@ -1454,9 +1948,7 @@ class ShellyEnergyReport:
         general_dir = self.general_report_dir
         general_dir.mkdir(exist_ok=True)
         
-        grafici_dir = general_dir / "grafici"
         dati_dir = general_dir / "dati"
-        grafici_dir.mkdir(exist_ok=True)
         dati_dir.mkdir(exist_ok=True)
         
         # Save complete data
@@ -1470,18 +1962,19 @@ class ShellyEnergyReport:
         # Save statistics
         stats_file = dati_dir / "statistiche_generali.json"
         with open(stats_file, 'w', encoding='utf-8') as f:
-            json.dump(general_analysis, f, indent=2, default=str)
+            json.dump(general_analysis, f, indent=2, default=_json_default)
         print(f"[INFO] Statistics saved: {stats_file.name}")
         
         # Create charts (always overwrite)
-        plot_paths = self._create_general_plots(grafici_dir)
-        print(f"[INFO] Charts generated: {len(plot_paths)}")
+        plot_charts = self._create_general_plots()
+        chart_files = self._save_charts(plot_charts, general_dir / "grafici")
+        print(f"[INFO] Charts generated: {len(plot_charts)}")
         
         # Create PDF (always overwrite existing file)
         pdf_path = self.pdf_generator.create_general_pdf(
             general_analysis, 
             general_dir, 
-            plot_paths, 
+            plot_charts, 
             self.all_data, 
             self.data_files
         )
@@ -1500,7 +1993,8 @@ class ShellyEnergyReport:
                 f.write(f"- report_generale.pdf (report completo)\n")
                 f.write(f"- dati_completi.csv (tutti i dati)\n")
                 f.write(f"- statistiche_generali.json (metriche)\n")
-                f.write(f"- grafici/ (immagini dei grafici)\n")
+                if chart_files:
+                    f.write(f"- grafici/ (immagini dei grafici)\n")
             
             print(f"[INFO] General report UPDATED: {pdf_path.name}")
         else:
@@ -1508,8 +2002,19 @@ class ShellyEnergyReport:
         
         return general_dir
     
-    def _create_device_report(self, device_id: str, friendly_name: str, device_data: pd.DataFrame):
-        """Crea report specifico per un singolo dispositivo."""
+    def _report_key(self, device_id: str, friendly_name: str, device_data: pd.DataFrame,
+                    cube: pd.DataFrame) -> str:
+        """Cache key of a device report: its rows, analysis cube, names, outputs and the generator version."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(_code_version().encode())
+        digest.update(json.dumps([device_id, str(friendly_name), list(device_data.columns)]).encode())
+        digest.update(pd.util.hash_pandas_object(device_data, index=False).to_numpy().tobytes())
+        if len(cube):
+            digest.update(pd.util.hash_pandas_object(cube, index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+    
+    def _device_paths(self, device_id: str) -> tuple:
+        """Sanitized name, chart and data folders and the timestamped PDF path of a device report."""
         # Sanitize device_id for filename
         safe_device_name = device_id.replace('.', '_').replace('/', '_').replace(':', '_')
         
@@ -1519,18 +2024,82 @@ class ShellyEnergyReport:
         
         grafici_dir = device_dir / "grafici"
         dati_dir = device_dir / "dati"
-        grafici_dir.mkdir(exist_ok=True)
         dati_dir.mkdir(exist_ok=True)
         
+        # Create PDF directly in pdfs directory with timestamp
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        pdf_filename = f"report_{safe_device_name}_{timestamp}.pdf"
+        pdf_path = Path(self.output_dir).parent / 'pdfs' / pdf_filename
+        pdf_path.parent.mkdir(parents=True, exist_ok=True)
+        return safe_device_name, grafici_dir, dati_dir, pdf_path
+    
+    def _restore_device_report(self, device_id: str, cache_key: str, device_data: pd.DataFrame) -> bool:
+        """
+        Rebuild a device report from its cached analysis and charts; False if the key is not cached.
+        
+        Only the PDF is rendered again, so it shows the current generation time.
+        """
+        cached = self.report_cache.get(cache_key)
+        if cached is None or REPORT_CHARTS_NAME not in cached:
+            return False
+        safe_device_name, grafici_dir, dati_dir, pdf_path = self._device_paths(device_id)
+        try:
+            with open(cached[f"{safe_device_name}_stats.json"], 'r', encoding='utf-8') as f:
+                analysis = json.load(f)
+            with open(cached[REPORT_CHARTS_NAME], 'r', encoding='utf-8') as f:
+                plot_charts = [RenderedChart.load(cached[f"{name}.png"]) for name in json.load(f)]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARN] Unusable cached report for {device_id}: {e}")
+            return False
+        for name, source in cached.items():
+            if name.endswith('.png'):
+                if not self.save_charts:
+                    continue
+                grafici_dir.mkdir(exist_ok=True)
+                shutil.copyfile(source, grafici_dir / name)
+            elif name != REPORT_CHARTS_NAME:
+                shutil.copyfile(source, dati_dir / name)
+        
+        self._create_device_pdf(analysis, pdf_path, plot_charts, device_data)
+        self._publish_device_pdf(cache_key, pdf_path)
+        print(f"[INFO] Device report rebuilt from cache: {pdf_path.name}")
+        return True
+    
+    def _publish_device_pdf(self, cache_key: str, pdf_path: Path):
+        """Record pdf_path as the report of a cache entry, removing the PDF it published before."""
+        if not pdf_path.exists():
+            return
+        previous = self.report_cache.published(cache_key)
+        if previous and previous != pdf_path.name:
+            (pdf_path.parent / previous).unlink(missing_ok=True)
+        self.report_cache.set_published(cache_key, pdf_path.name)
+    
+    def _create_device_report(self, device_id: str, friendly_name: str, device_data: pd.DataFrame,
+                              cache_key: str = None):
+        """
+        Crea report specifico per un singolo dispositivo.
+        
+        Data CSV, statistics and charts are cached under a hash of the device's rows and the
+        generator version; for an unchanged device only the PDF is built again from the cache.
+        Callers that already missed the cache pass its key.
+        """
+        cube = self._device_cube(device_id)
+        if cache_key is None:
+            cache_key = self._report_key(device_id, friendly_name, device_data, cube)
+            if self._restore_device_report(device_id, cache_key, device_data):
+                return
+        safe_device_name, grafici_dir, dati_dir, pdf_path = self._device_paths(device_id)
+        
         # Save device data
         data_file = dati_dir / f"{safe_device_name}_dati.csv"
         device_data.to_csv(data_file, index=False)
         
         # Analyze device data
+        power = _power_summary(device_data)
         analysis = {
             'device_id': device_id,
             'friendly_name': friendly_name,
-            'total_data_points': len(device_data),
+            'total_data_points': power['data_points'],
             'date_range': {
                 'start': device_data['datetime'].min().strftime('%Y-%m-%d %H:%M') if 'datetime' in device_data.columns else 'N/A',
                 'end': device_data['datetime'].max().strftime('%Y-%m-%d %H:%M') if 'datetime' in device_data.columns else 'N/A'
@@ -1539,90 +2108,85 @@ class ShellyEnergyReport:
         
         if 'total_act_energy' in device_data.columns:
             analysis['total_energy_kwh'] = device_data['total_act_energy'].sum() / 1000
-            analysis['avg_power_w'] = device_data['total_act_energy'].mean()
-            analysis['max_power_w'] = device_data['total_act_energy'].max()
-            analysis['min_power_w'] = device_data['total_act_energy'].min()
-        
-        if 'max_act_power' in device_data.columns:
-            analysis['peak_power_w'] = device_data['max_act_power'].max()
-            analysis['avg_power_w'] = device_data['max_act_power'].mean()
+        for key in ('avg_power_w', 'max_power_w', 'min_power_w'):
+            if key in power:
+                analysis[key] = power[key]
+        if 'max_power_w' in power:
+            analysis['peak_power_w'] = power['max_power_w']
         
         # Save statistics
         stats_file = dati_dir / f"{safe_device_name}_stats.json"
         with open(stats_file, 'w', encoding='utf-8') as f:
-            json.dump(analysis, f, indent=2, default=str)
+            json.dump(analysis, f, indent=2, default=_json_default)
         
         # Create plots
-        plot_paths = self._create_device_plots(device_data, grafici_dir, safe_device_name)
+        plot_charts = self._create_device_plots(device_data, safe_device_name, cube)
+        chart_files = self._save_charts(plot_charts, grafici_dir)
         
-        # Create PDF directly in pdfs directory with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        pdf_filename = f"report_{safe_device_name}_{timestamp}.pdf"
-        pdf_path = Path(self.output_dir).parent / 'pdfs' / pdf_filename
-        pdf_path.parent.mkdir(parents=True, exist_ok=True)
-        self._create_device_pdf(analysis, pdf_path, plot_paths, device_data)
+        self._create_device_pdf(analysis, pdf_path, plot_charts, device_data)
         
         print(f"[INFO] Device report created: {pdf_path.name}")
+        
+        if pdf_path.exists():
+            try:
+                with tempfile.TemporaryDirectory() as scratch:
+                    scratch = Path(scratch)
+                    if not self.save_charts:
+                        chart_files = [chart.save(scratch, compress_level=1) for chart in plot_charts]
+                    names_file = scratch / REPORT_CHARTS_NAME
+                    names_file.write_text(json.dumps([chart.name for chart in plot_charts]), encoding='utf-8')
+                    files = {path.name: path for path in [data_file, stats_file, *chart_files, names_file]}
+                    self.report_cache.put(cache_key, files)
+                self._publish_device_pdf(cache_key, pdf_path)
+            except OSError as e:
+                print(f"[WARN] Could not cache device report: {e}")
     
-    def _create_device_plots(self, device_data: pd.DataFrame, output_dir: Path, device_name: str) -> List[Path]:
-        """Create graphs for every device."""
-        plot_paths = []
+    def _create_device_plots(self, device_data: pd.DataFrame, device_name: str,
+                             cube: pd.DataFrame = None) -> List[RenderedChart]:
+        """Create graphs for every device; daily and hourly charts come from its analysis cube."""
+        plot_charts = []
         
         if len(device_data) == 0:
-            return plot_paths
+            return plot_charts
+        
+        cube = build_analysis_cube(device_data) if cube is None else cube
+        
+        charts = chart_renderer()
         
         # 1. Power trend over time
         if 'datetime' in device_data.columns and 'max_act_power' in device_data.columns:
-            fig, ax = plt.subplots(figsize=(12, 6))
-            ax.plot(device_data['datetime'], device_data['max_act_power'], 'b-', linewidth=1.5, alpha=0.8)
-            ax.set_title(f'Andamento Potenza nel Tempo', fontsize=14, fontweight='bold')
-            ax.set_xlabel('Data/Ora', fontsize=12)
-            ax.set_ylabel('Potenza (W)', fontsize=12)
-            ax.grid(True, alpha=0.3)
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m %H:%M'))
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            plot_path = output_dir / f"{device_name}_power_trend.png"
-            plt.savefig(plot_path, dpi=150, bbox_inches='tight')
-            plot_paths.append(plot_path)
-            plt.close()
+            plot_charts.append(charts.line(
+                f"{device_name}_power_trend",
+                device_data['datetime'], device_data['max_act_power'],
+                'Andamento Potenza nel Tempo', 'Data/Ora', 'Potenza (W)',
+                date_format='%d/%m %H:%M', rotation=45,
+            ))
         
         # 2. Daily energy consumption
-        if 'date' in device_data.columns and 'total_act_energy' in device_data.columns:
-            daily_energy = device_data.groupby('date')['total_act_energy'].sum() / 1000  # kWh
-            fig, ax = plt.subplots(figsize=(12, 6))
-            ax.bar(range(len(daily_energy)), daily_energy.values, alpha=0.7, color='steelblue')
-            ax.set_title(f'Consumo Energetico Giornaliero', fontsize=14, fontweight='bold')
-            ax.set_xlabel('Giorno', fontsize=12)
-            ax.set_ylabel('Energia (kWh)', fontsize=12)
-            ax.set_xticks(range(len(daily_energy)))
-            ax.set_xticklabels([d.strftime('%d/%m') for d in daily_energy.index], rotation=45)
-            ax.grid(True, alpha=0.3, axis='y')
-            plt.tight_layout()
-            plot_path = output_dir / f"{device_name}_daily_energy.png"
-            plt.savefig(plot_path, dpi=150, bbox_inches='tight')
-            plot_paths.append(plot_path)
-            plt.close()
+        if 'energy_sum' in cube.columns:
+            daily_energy = (cube.groupby('epoch_day')['energy_sum'].sum() / 1000).rename(index=day_to_date)  # kWh
+            positions = np.arange(len(daily_energy))
+            plot_charts.append(charts.bars(
+                f"{device_name}_daily_energy",
+                positions, daily_energy.values,
+                'Consumo Energetico Giornaliero', 'Giorno', 'Energia (kWh)',
+                ticks=positions, tick_labels=[d.strftime('%d/%m') for d in daily_energy.index], rotation=45,
+            ))
         
         # 3. Hourly profile
-        if 'hour' in device_data.columns and 'max_act_power' in device_data.columns:
-            hourly_avg = device_data.groupby('hour')['max_act_power'].mean()
-            fig, ax = plt.subplots(figsize=(10, 6))
-            ax.bar(hourly_avg.index, hourly_avg.values, alpha=0.7, color='steelblue')
-            ax.set_title(f'Profilo Orario Medio', fontsize=14, fontweight='bold')
-            ax.set_xlabel('Ora del Giorno', fontsize=12)
-            ax.set_ylabel('Potenza Media (W)', fontsize=12)
-            ax.set_xticks(range(0, 24, 2))
-            ax.grid(True, alpha=0.3, axis='y')
-            plt.tight_layout()
-            plot_path = output_dir / f"{device_name}_hourly_profile.png"
-            plt.savefig(plot_path, dpi=150, bbox_inches='tight')
-            plot_paths.append(plot_path)
-            plt.close()
-        
-        return plot_paths
-    
-    def _create_device_pdf(self, analysis: Dict, pdf_path: Path, plot_paths: List[Path], device_data: pd.DataFrame):
+        if 'power_sum' in cube.columns:
+            hourly = cube.groupby('hour')[['power_sum', 'power_count']].sum()
+            hourly_avg = _divide(hourly['power_sum'], hourly['power_count'])
+            plot_charts.append(charts.bars(
+                f"{device_name}_hourly_profile",
+                hourly_avg.index, hourly_avg.values,
+                'Profilo Orario Medio', 'Ora del Giorno', 'Potenza Media (W)',
+                figsize=(10, 6), ticks=range(0, 24, 2),
+            ))
+        
+        return plot_charts
+    
+    def _create_device_pdf(self, analysis: Dict, pdf_path: Path, charts: List[RenderedChart], device_data: pd.DataFrame):
         """Create PDF per device using the existing generator."""
         try:
             # Use the existing PDF generator with device-specific data
@@ -1727,7 +2291,8 @@ class ShellyEnergyReport:
             story.append(Spacer(1, 15))
             
             # Pattern di consumo
-            patterns = self._analyze_consumption_patterns(device_data)
+            results = self._device_results(analysis['device_id'], device_data)
+            patterns = self._analyze_consumption_patterns(device_data, results)
             if patterns and 'time_bands' in patterns:
                 bands_section = []
                 bands_section.append(Paragraph("Distribuzione Consumi per Fascia Oraria", self.pdf_generator.styles['SubTitle']))
@@ -1781,7 +2346,7 @@ class ShellyEnergyReport:
             
             # Anomalie
             from reportlab.platypus import KeepTogether
-            anomalies = self._detect_anomalies(device_data)
+            anomalies = self._detect_anomalies(device_data, results)
             if anomalies:
                 anomalies_section = []
                 anomalies_section.append(Paragraph("Anomalie e Picchi", self.pdf_generator.styles['SubTitle']))
@@ -1807,7 +2372,7 @@ class ShellyEnergyReport:
             
             # Impatto ambientale
             from reportlab.platypus import KeepTogether
-            environmental = self._calculate_environmental_impact(device_data)
+            environmental = self._calculate_environmental_impact(device_data, results)
             if environmental:
                 env_section = []
                 env_section.append(Paragraph("Impatto Ambientale", self.pdf_generator.styles['SubTitle']))
@@ -1838,7 +2403,7 @@ class ShellyEnergyReport:
                 story.append(Spacer(1, 10))
             
             # Previsioni
-            predictions = self._generate_predictions(device_data)
+            predictions = self._generate_predictions(device_data, results)
             if predictions:
                 story.append(Paragraph("Previsioni", self.pdf_generator.styles['SubTitle']))
                 pred_text = []
@@ -1857,7 +2422,7 @@ class ShellyEnergyReport:
             
             # Qualità rete
             from reportlab.platypus import KeepTogether
-            quality = self._analyze_power_quality(device_data)
+            quality = self._analyze_power_quality(device_data, results)
             if quality and 'voltage' in quality:
                 quality_section = []
                 quality_section.append(Paragraph("Qualità Rete", self.pdf_generator.styles['SubTitle']))
@@ -1894,11 +2459,9 @@ class ShellyEnergyReport:
             story.append(Paragraph("3. GRAFICI DI SINTESI", self.pdf_generator.styles['SectionTitle']))
             story.append(Spacer(1, 15))
             
-            for plot_path in plot_paths:
-                if plot_path.exists():
-                    img = Image(str(plot_path), width=15*cm, height=9*cm)
-                    story.append(img)
-                    story.append(Spacer(1, 10))
+            for chart in charts:
+                story.append(ChartImage(chart, width=15*cm, height=9*cm))
+                story.append(Spacer(1, 10))
             
             # 4. RACCOMANDAZIONI E PIANO DI AZIONE
             story.append(PageBreak())
@@ -2032,13 +2595,80 @@ class ShellyEnergyReport:
         except Exception as e:
             print(f"[ERROR] Error creating PDF: {e}")
     
-    def run_analysis(self):
-        """Execute complete analysis with separate reports per device."""
+    def _worker_count(self, jobs: int) -> int:
+        return max(1, min(resolve_workers(self.workers), jobs))
+    
+    def _create_device_reports_parallel(self, pending: List[tuple], workers: int):
+        """
+        Build device reports on the executor, or on a spawn-context process pool of this run.
+        
+        Each job receives only its device rows and cube as Arrow IPC bytes plus its row of the
+        fleet results. Worker output is printed in device order once each report is done.
+        """
+        if self.executor is not None:
+            print(f"[INFO] Building {len(pending)} device reports on the worker pool")
+            self._run_device_jobs(self.executor, pending)
+            return
+        print(f"[INFO] Building {len(pending)} device reports on {workers} processes")
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            self._run_device_jobs(pool, pending)
+    
+    def _submit_device_job(self, pool, device_id: str, friendly_name: str, cache_key: str):
+        """Submit one device report, or return None if the pool no longer takes jobs."""
+        try:
+            return pool.submit(
+                _device_report_job,
+                str(self.data_dir),
+                str(self.output_dir),
+                device_id,
+                friendly_name,
+                cache_key,
+                _frame_to_ipc(self.device_rows(device_id)),
+                _frame_to_ipc(self._device_cube(device_id)),
+                self.fleet_results.loc[[device_id]] if device_id in self.fleet_results.index else None,
+                self.save_charts,
+            )
+        except (BrokenProcessPool, RuntimeError):
+            return None
+    
+    def _run_device_jobs(self, pool, pending: List[tuple]):
+        """
+        Run the device jobs on the pool and print their logs in device order.
+        
+        A device whose job was lost with its worker process (broken, shut down or cancelled
+        pool) is built in this process instead.
+        """
+        futures = [self._submit_device_job(pool, *job) for job in pending]
+        for (device_id, friendly_name, cache_key), future in zip(pending, futures):
+            try:
+                if future is None:
+                    raise BrokenProcessPool("the worker pool does not accept jobs")
+                print(future.result(), end='')
+                continue
+            except (BrokenProcessPool, CancelledError) as e:
+                print(f"[WARN] Report worker lost for {device_id} ({e or 'cancelled'}), building it here")
+            except Exception as e:
+                print(f"[ERROR] Device report failed for {device_id}: {e}")
+                continue
+            try:
+                self._create_device_report(device_id, friendly_name, self.device_rows(device_id), cache_key)
+            except Exception as e:
+                print(f"[ERROR] Device report failed for {device_id}: {e}")
+    
+    def run_analysis(self, data=None, start=None, end=None):
+        """
+        Execute complete analysis with separate reports per device.
+        
+        If data (DataFrame or Arrow table) is given it is analyzed directly instead of
+        loading from the data folder. Only the selected entities and the [start, end)
+        window are loaded.
+        """
         print("=" * 60)
         print("SHELLY EM CONSUMPTION ANALYZER - PDF REPORT PER DEVICE")
         print("=" * 60)
         
-        if not self.data_dir.exists():
+        if data is None and self.all_data is None and not self.data_dir.exists():
             print(f"[ERROR] Data folder not found: {self.data_dir}")
             print(f"[INFO] Create 'data' folder and insert CSV files")
             return
@@ -2046,7 +2676,10 @@ class ShellyEnergyReport:
         self._create_output_structure()
         
         try:
-            self.load_all_data()
+            if data is not None:
+                self.load_data(data, self.selected_entities or None, start, end)
+            elif self.all_data is None:
+                self.load_all_data(start=start, end=end)
         except Exception as e:
             print(f"[ERROR] Error loading data: {e}")
             return
@@ -2058,7 +2691,7 @@ class ShellyEnergyReport:
             return
         
         # Get unique devices
-        unique_devices = self.all_data['entity_id'].unique()
+        unique_devices = list(self.device_index)
         print(f"[INFO] Total devices in data: {len(unique_devices)}")
         
         # Filter by selected entities if available
@@ -2070,22 +2703,35 @@ class ShellyEnergyReport:
             if len(unique_devices) == 0:
                 print("[WARN] No selected devices found in data. Possible entity_id mismatch.")
                 print("[INFO] Available entity_ids in data:")
-                for eid in self.all_data['entity_id'].unique():
+                for eid in self.device_index:
                     print(f"  - {eid}")
                 return
         else:
             print(f"[INFO] No selection filter - processing all {len(unique_devices)} devices")
         
+        # Metriche di tutti i dispositivi in un'unica passata raggruppata
+        self.fleet_results = analyze_fleet(self.all_data, self._analysis_cube())
+        
+        pending = []
         for device_id in unique_devices:
-            device_data = self.all_data[self.all_data['entity_id'] == device_id].copy()
+            device_data = self.device_rows(device_id)
             friendly_name = device_data['friendly_name'].iloc[0] if 'friendly_name' in device_data.columns and len(device_data) > 0 else device_id
             
             print(f"[INFO] Analyzing device: {friendly_name}")
             print(f"  - Entity ID: {device_id}")
             print(f"  - Data: {len(device_data)} rows")
             
-            # Create device-specific report
-            self._create_device_report(device_id, friendly_name, device_data)
+            cache_key = self._report_key(device_id, friendly_name, device_data, self._device_cube(device_id))
+            if not self._restore_device_report(device_id, cache_key, device_data):
+                pending.append((device_id, friendly_name, cache_key))
+        
+        # Create device-specific reports
+        workers = self._worker_count(len(pending))
+        if pending and (self.executor is not None or workers > 1):
+            self._create_device_reports_parallel(pending, workers)
+        else:
+            for device_id, friendly_name, cache_key in pending:
+                self._create_device_report(device_id, friendly_name, self.device_rows(device_id), cache_key)
         
         print(f"[INFO] Analysis completed for {len(unique_devices)} devices")
         
@@ -2106,6 +2752,22 @@ class ShellyEnergyReport:
         print("=" * 60)
 
 
+def _device_report_job(data_dir: str, output_dir: str, device_id: str, friendly_name: str, cache_key: str,
+                       rows: bytes, cube: bytes, results, save_charts: bool = False) -> str:
+    """Process pool entry point: build one device report from its IPC slices and return the log."""
+    report = ShellyEnergyReport(data_dir=data_dir, output_dir=output_dir, correct_timestamps=False,
+                                save_charts=save_charts)
+    report.daily_reports_dir = report.output_dir / "giornalieri"
+    report.general_report_dir = report.output_dir / "generale"
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        report.all_data = report._index_rows(_frame_from_ipc(rows))
+        report.analysis_cube = _frame_from_ipc(cube)
+        report.fleet_results = results
+        report._create_device_report(device_id, friendly_name, report.device_rows(device_id), cache_key)
+    return log.getvalue()
+
+
 def main():
     print("=" * 60)
     print("SHELLY ENERGY ANALYZER - PROFESSIONAL PDF REPORTS")
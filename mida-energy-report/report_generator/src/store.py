@@ -0,0 +1,964 @@
+"""
+Columnar Parquet store for collected energy samples.
+
+Layout (hive partitioning, one file per entity and UTC day):
+    <data_dir>/store/<table>/entity_id=<entity_id>/date=<YYYY-MM-DD>/part-0.parquet
+
+Samples are also kept as rollup tiers of increasing bucket size, recomputed for the days a
+write touches. The 1-minute and 15-minute tiers use the day layout above; the hourly and
+daily tiers keep one file per entity:
+    <data_dir>/store/<minute|quarter>/entity_id=<entity_id>/date=<YYYY-MM-DD>/part-0.parquet
+    <data_dir>/store/<hourly|daily>/entity_id=<entity_id>/part-0.parquet
+
+Each tier can have its own retention; compact() drops expired days once the next coarser
+tier covers them.
+
+Frequent small writes (the live buffer) go through append(), which adds a
+part-<time_ns>.parquet file next to part-0 instead of rewriting the day; merge_appends()
+later folds those files into part-0 and updates the rollups.
+"""
+from __future__ import annotations
+
+import codecs
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from array import array
+from datetime import datetime, timezone
+from itertools import repeat
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+STORE_DIRNAME = "store"
+LOAD_CACHE_DIRNAME = ".cache"
+REPORT_CACHE_DIRNAME = "analysis"
+REPORT_CACHE_ENTRIES = 256
+REPORT_PUBLISHED_NAME = "published.txt"
+NOMINAL_VOLTAGE = 230.0
+
+SAMPLES_SCHEMA = pa.schema([
+    ("timestamp", pa.int64()),
+    ("friendly_name", pa.dictionary(pa.int32(), pa.string())),
+    ("value", pa.float64()),
+])
+
+# Pre-aggregated rows from the recorder long-term statistics; energy is in Wh per period
+STATISTICS_SCHEMA = pa.schema([
+    ("timestamp", pa.int64()),
+    ("friendly_name", pa.dictionary(pa.int32(), pa.string())),
+    ("period", pa.int32()),
+    ("mean", pa.float64()),
+    ("min", pa.float64()),
+    ("max", pa.float64()),
+    ("energy", pa.float64()),
+])
+
+# Per-bucket aggregates of the samples table; timestamp is the UTC bucket start
+ROLLUP_SCHEMA = pa.schema([
+    ("timestamp", pa.int64()),
+    ("friendly_name", pa.dictionary(pa.int32(), pa.string())),
+    ("count", pa.int64()),
+    ("sum", pa.float64()),
+    ("mean", pa.float64()),
+    ("min", pa.float64()),
+    ("max", pa.float64()),
+])
+ROLLUP_PERIODS = {
+    "minute": 60,
+    "quarter": 900,
+    "hourly": 3600,
+    "daily": 86400,
+}
+# Storage tiers from finest to coarsest; small tiers keep one file per entity
+STORAGE_TIERS = ("samples",) + tuple(ROLLUP_PERIODS)
+ENTITY_FILE_TIERS = ("hourly", "daily")
+
+TABLE_SCHEMAS = {
+    "samples": SAMPLES_SCHEMA,
+    "statistics": STATISTICS_SCHEMA,
+    **{tier: ROLLUP_SCHEMA for tier in ROLLUP_PERIODS},
+}
+
+# Columns the report reads from CSV exports; anything else in the file is skipped.
+# Names are parsed as strings (so batches can be streamed to the load cache) and
+# dictionary-encoded once the rows are filtered.
+CATEGORY_COLUMNS = ("entity_id", "friendly_name")
+CSV_COLUMN_TYPES = {
+    "timestamp": pa.int64(),
+    "entity_id": pa.string(),
+    "friendly_name": pa.string(),
+    "total_act_energy": pa.float32(),
+    "max_act_power": pa.float32(),
+    "min_act_power": pa.float32(),
+    "avg_voltage": pa.float32(),
+    "avg_current": pa.float32(),
+    "lag_react_energy": pa.float32(),
+}
+CSV_SNIFF_BYTES = 64 * 1024
+
+PARTITION_SCHEMA = pa.schema([
+    ("entity_id", pa.string()),
+    ("date", pa.string()),
+])
+ROLLUP_PARTITION_SCHEMA = pa.schema([
+    ("entity_id", pa.string()),
+])
+
+
+def _day_label(day: int) -> str:
+    return datetime.fromtimestamp(int(day) * 86400, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def _label_day(label: str) -> int:
+    return int(datetime.strptime(label, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()) // 86400
+
+
+def _write_parquet(table: pa.Table, path: Path):
+    """Write a table atomically (temporary file, then rename)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    pq.write_table(table, tmp_path, compression="zstd", use_dictionary=True)
+    os.replace(tmp_path, path)
+
+
+class EntityBlock:
+    """Typed columns for one entity: int64 epoch seconds and float64 values."""
+
+    __slots__ = ("entity_id", "friendly_name", "timestamps", "values")
+
+    def __init__(self, entity_id: str, friendly_name: str, timestamps: np.ndarray, values: np.ndarray):
+        self.entity_id = entity_id
+        self.friendly_name = friendly_name
+        self.timestamps = timestamps
+        self.values = values
+
+    @classmethod
+    def from_states(cls, entity_id: str, friendly_name: str, states, scale: float = 1.0) -> "EntityBlock":
+        """Build a block from recorder states, dropping non-numeric ones.
+
+        Accepts compressed state dicts ("s" and "lc"/"lu" epoch floats) as well as State objects.
+        """
+        timestamps = array("d")
+        values = array("d")
+        for state in states:
+            try:
+                if isinstance(state, dict):
+                    value = float(state["s"])
+                    timestamp = state.get("lc", state["lu"])
+                else:
+                    value = float(state.state)
+                    timestamp = state.last_changed.timestamp()
+                timestamps.append(timestamp)
+            except (KeyError, AttributeError, ValueError, TypeError):
+                continue
+            values.append(value)
+
+        block_values = np.frombuffer(values, dtype=np.float64)
+        if scale != 1.0:
+            block_values = block_values * scale
+        return cls(entity_id, friendly_name, np.frombuffer(timestamps, dtype=np.float64).astype(np.int64), block_values)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def filter(self, mask: np.ndarray) -> "EntityBlock":
+        return EntityBlock(self.entity_id, self.friendly_name, self.timestamps[mask], self.values[mask])
+
+    def to_table(self) -> pa.Table:
+        """Samples table for this entity, with a dictionary of a single friendly_name."""
+        names = pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(len(self), dtype=np.int32)),
+            pa.array([self.friendly_name], type=pa.string()),
+        )
+        return pa.table({
+            "timestamp": pa.array(self.timestamps, type=pa.int64()),
+            "friendly_name": names,
+            "value": pa.array(self.values, type=pa.float64()),
+        }, schema=SAMPLES_SCHEMA)
+
+
+def blocks_table(blocks: Iterable[EntityBlock]) -> pa.Table:
+    """Concatenate entity blocks into one samples table with an entity_id column."""
+    tables = []
+    for block in blocks:
+        if len(block) == 0:
+            continue
+        table = block.to_table()
+        entity_ids = pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(len(block), dtype=np.int32)),
+            pa.array([block.entity_id], type=pa.string()),
+        )
+        tables.append(table.add_column(0, "entity_id", entity_ids))
+    if not tables:
+        raise ValueError("No samples in entity blocks")
+    return pa.concat_tables(tables).unify_dictionaries().combine_chunks()
+
+
+def samples_table(timestamps, friendly_names, values) -> pa.Table:
+    """Build a samples table from parallel columns."""
+    return pa.table({
+        "timestamp": pa.array(timestamps, type=pa.int64()),
+        "friendly_name": pa.array(friendly_names, type=pa.string()).dictionary_encode(),
+        "value": pa.array(values, type=pa.float64()),
+    }).cast(SAMPLES_SCHEMA)
+
+
+def expand_samples(table: pa.Table) -> pa.Table:
+    """Map raw HA samples onto the columns the report generator expects."""
+    value = table.column("value")
+    columns = {
+        name: table.column(name)
+        for name in table.column_names
+        if name != "value"
+    }
+    columns["total_act_energy"] = value
+    columns["max_act_power"] = value
+    columns["avg_voltage"] = pa.array(np.full(len(table), NOMINAL_VOLTAGE))
+    columns["avg_current"] = pc.divide(value, NOMINAL_VOLTAGE)
+    return pa.table(columns)
+
+
+def statistics_table(timestamps, friendly_names, period, means, mins, maxs, energies) -> pa.Table:
+    """Build a statistics table from parallel columns and a fixed period in seconds."""
+    return pa.table({
+        "timestamp": pa.array(timestamps, type=pa.int64()),
+        "friendly_name": pa.array(friendly_names, type=pa.string()).dictionary_encode(),
+        "period": pa.array(np.full(len(timestamps), period, dtype=np.int32)),
+        "mean": pa.array(means, type=pa.float64()),
+        "min": pa.array(mins, type=pa.float64()),
+        "max": pa.array(maxs, type=pa.float64()),
+        "energy": pa.array(energies, type=pa.float64()),
+    }).cast(STATISTICS_SCHEMA)
+
+
+def expand_statistics(table: pa.Table) -> pa.Table:
+    """Map statistics rows onto the report columns, one row per statistics period."""
+    aggregates = {"period", "mean", "min", "max", "energy"}
+    columns = {
+        name: table.column(name)
+        for name in table.column_names
+        if name not in aggregates
+    }
+    columns["total_act_energy"] = table.column("energy")
+    columns["avg_act_power"] = table.column("mean")
+    columns["max_act_power"] = table.column("max")
+    columns["min_act_power"] = table.column("min")
+    columns["avg_voltage"] = pa.array(np.full(len(table), NOMINAL_VOLTAGE))
+    columns["avg_current"] = pc.divide(table.column("mean"), NOMINAL_VOLTAGE)
+    return pa.table(columns)
+
+
+EXPANDERS = {
+    "samples": expand_samples,
+    "statistics": expand_statistics,
+}
+
+
+def expand_rollup(table: pa.Table) -> pa.Table:
+    """
+    Map rollup buckets onto the report columns, one row per bucket (like statistics).
+
+    total_act_energy is the bucket sum, so energy totals match the samples; sample_count
+    carries the number of samples so means can be weighted by it.
+    """
+    aggregates = {"count", "sum", "mean", "min", "max"}
+    columns = {
+        name: table.column(name)
+        for name in table.column_names
+        if name not in aggregates
+    }
+    columns["sample_count"] = table.column("count")
+    columns["total_act_energy"] = table.column("sum")
+    columns["avg_act_power"] = table.column("mean")
+    columns["max_act_power"] = table.column("max")
+    columns["min_act_power"] = table.column("min")
+    columns["avg_voltage"] = pa.array(np.full(len(table), NOMINAL_VOLTAGE))
+    columns["avg_current"] = pc.divide(table.column("mean"), NOMINAL_VOLTAGE)
+    return pa.table(columns)
+
+
+EXPANDERS.update({tier: expand_rollup for tier in ROLLUP_PERIODS})
+
+
+def tier_retention(config: dict) -> dict:
+    """Per-tier retention in days (0 = forever) from a storage config of "<tier>_days" keys."""
+    return {tier: int(config.get(f"{tier}_days", 0) or 0) for tier in STORAGE_TIERS}
+
+
+def _bucket_starts(buckets: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.append(True, buckets[1:] != buckets[:-1]))
+
+
+def rollup_table(data: pa.Table, period: int) -> pa.Table:
+    """Aggregate time-sorted samples into count/sum/mean/min/max buckets of period seconds."""
+    if len(data) == 0:
+        return ROLLUP_SCHEMA.empty_table()
+    buckets = data.column("timestamp").to_numpy() // period * period
+    values = data.column("value").to_numpy()
+    starts = _bucket_starts(buckets)
+    counts = np.diff(np.append(starts, len(buckets)))
+    sums = np.add.reduceat(values, starts)
+    return pa.table({
+        "timestamp": pa.array(buckets[starts]),
+        "friendly_name": data.column("friendly_name").take(pa.array(starts)),
+        "count": pa.array(counts, type=pa.int64()),
+        "sum": pa.array(sums),
+        "mean": pa.array(sums / counts),
+        "min": pa.array(np.minimum.reduceat(values, starts)),
+        "max": pa.array(np.maximum.reduceat(values, starts)),
+    }).cast(ROLLUP_SCHEMA)
+
+
+def merge_buckets(data: pa.Table, period: int) -> pa.Table:
+    """Downsample time-sorted rollup buckets into coarser buckets of period seconds."""
+    if len(data) == 0:
+        return ROLLUP_SCHEMA.empty_table()
+    buckets = data.column("timestamp").to_numpy() // period * period
+    starts = _bucket_starts(buckets)
+    counts = np.add.reduceat(data.column("count").to_numpy(), starts)
+    sums = np.add.reduceat(data.column("sum").to_numpy(), starts)
+    return pa.table({
+        "timestamp": pa.array(buckets[starts]),
+        "friendly_name": data.column("friendly_name").take(pa.array(starts)),
+        "count": pa.array(counts, type=pa.int64()),
+        "sum": pa.array(sums),
+        "mean": pa.array(sums / counts),
+        "min": pa.array(np.minimum.reduceat(data.column("min").to_numpy(), starts)),
+        "max": pa.array(np.maximum.reduceat(data.column("max").to_numpy(), starts)),
+    }).cast(ROLLUP_SCHEMA)
+
+
+def _epoch(value) -> Optional[int]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+def row_mask(data, entity_ids: Optional[Iterable[str]] = None, start=None, end=None):
+    """Boolean mask of rows for the given entities and [start, end) window, or None for all rows."""
+    masks = []
+    if entity_ids is not None and "entity_id" in data.schema.names:
+        masks.append(pc.is_in(data.column("entity_id"), value_set=pa.array(list(entity_ids), type=pa.string())))
+    start, end = _epoch(start), _epoch(end)
+    if start is not None:
+        masks.append(pc.greater_equal(data.column("timestamp"), start))
+    if end is not None:
+        masks.append(pc.less(data.column("timestamp"), end))
+    if not masks:
+        return None
+    mask = masks[0]
+    for other in masks[1:]:
+        mask = pc.and_(mask, other)
+    return pc.fill_null(mask, False)
+
+
+def filter_rows(table: pa.Table, entity_ids: Optional[Iterable[str]] = None, start=None, end=None) -> pa.Table:
+    mask = row_mask(table, entity_ids, start, end)
+    return table if mask is None else table.filter(mask)
+
+
+def encode_categories(table: pa.Table) -> pa.Table:
+    """Dictionary-encode the name columns so they load as pandas categoricals."""
+    for name in CATEGORY_COLUMNS:
+        if name in table.column_names and not pa.types.is_dictionary(table.schema.field(name).type):
+            index = table.column_names.index(name)
+            table = table.set_column(index, name, pc.dictionary_encode(table.column(name)))
+    return table
+
+
+def expand_table(table: pa.Table) -> pa.Table:
+    """Expand a samples or statistics table; tables already in report columns pass through."""
+    if "value" in table.column_names:
+        return expand_samples(table)
+    if "energy" in table.column_names and "mean" in table.column_names:
+        return expand_statistics(table)
+    return table
+
+
+class EnergyDataStore:
+    """Parquet dataset partitioned by entity_id and day."""
+
+    def __init__(self, data_dir):
+        self.root = Path(data_dir) / STORE_DIRNAME
+
+    def table_path(self, table: str) -> Path:
+        return self.root / table
+
+    def _partition_path(self, table: str, entity_id: str, day: int) -> Path:
+        return self.table_path(table) / f"entity_id={entity_id}" / f"date={_day_label(day)}" / "part-0.parquet"
+
+    @staticmethod
+    def _file_pattern(table: str) -> str:
+        return "entity_id=*/*.parquet" if table in ENTITY_FILE_TIERS else "entity_id=*/date=*/*.parquet"
+
+    def files(self, table: str = "samples") -> List[Path]:
+        path = self.table_path(table)
+        if not path.exists():
+            return []
+        return sorted(path.glob(self._file_pattern(table)))
+
+    def has_data(self, table: str = "samples") -> bool:
+        path = self.table_path(table)
+        return path.exists() and any(path.glob(self._file_pattern(table)))
+
+    def entity_ids(self, table: str = "samples") -> List[str]:
+        path = self.table_path(table)
+        if not path.exists():
+            return []
+        return sorted(p.name.split("=", 1)[1] for p in path.glob("entity_id=*") if p.is_dir())
+
+    def write(self, entity_id: str, data: pa.Table, table: str = "samples") -> int:
+        """Merge rows for one entity into its day partitions, replacing duplicate timestamps."""
+        if len(data) == 0:
+            return 0
+
+        schema = TABLE_SCHEMAS[table]
+        data = data.select(schema.names).cast(schema)
+        days = data.column("timestamp").to_numpy() // 86400
+
+        parts = {}
+        for day in np.unique(days):
+            part = data.filter(pa.array(days == day))
+            path = self._partition_path(table, entity_id, day)
+            if path.exists():
+                existing = pq.read_table(path, schema=schema)
+                part = pa.concat_tables([existing, part]).unify_dictionaries()
+
+            # Stable sort keeps the newest copy last among equal timestamps
+            part = part.take(pc.sort_indices(part, sort_keys=[("timestamp", "ascending")]))
+            timestamps = part.column("timestamp").to_numpy()
+            keep = np.append(timestamps[1:] != timestamps[:-1], True)
+            part = part.filter(pa.array(keep))
+            _write_parquet(part, path)
+            parts[int(day)] = part
+
+        if table == "samples":
+            self._update_rollups(entity_id, parts)
+        return len(data)
+
+    def append(self, entity_id: str, data: pa.Table) -> int:
+        """Add samples for one entity as new part files, without rewriting existing ones.
+
+        read() sees appended rows right away; the rollup tiers only after merge_appends().
+        """
+        if len(data) == 0:
+            return 0
+
+        data = data.select(SAMPLES_SCHEMA.names).cast(SAMPLES_SCHEMA)
+        days = data.column("timestamp").to_numpy() // 86400
+        name = f"part-{time.time_ns()}.parquet"
+        for day in np.unique(days):
+            path = self._partition_path("samples", entity_id, day).with_name(name)
+            _write_parquet(data.filter(pa.array(days == day)), path)
+        return len(data)
+
+    def merge_appends(self) -> int:
+        """Fold appended part files into their day partitions; returns the number of files merged."""
+        appended: Dict[str, List[Path]] = {}
+        for path in self.files("samples"):
+            if path.name != "part-0.parquet":
+                appended.setdefault(path.parent.parent.name.split("=", 1)[1], []).append(path)
+
+        for entity_id, paths in appended.items():
+            # Oldest append first, so write() keeps the newest copy of a timestamp
+            paths.sort(key=lambda path: int(path.stem.split("-", 1)[1]))
+            data = pa.concat_tables([pq.read_table(path, schema=SAMPLES_SCHEMA) for path in paths])
+            self.write(entity_id, data.unify_dictionaries())
+            for path in paths:
+                path.unlink()
+        return sum(len(paths) for paths in appended.values())
+
+    def _rollup_path(self, rollup: str, entity_id: str) -> Path:
+        return self.table_path(rollup) / f"entity_id={entity_id}" / "part-0.parquet"
+
+    def _update_rollups(self, entity_id: str, parts: dict):
+        """Recompute every rollup tier for the given rewritten day partitions."""
+        days = sorted(parts)
+        for rollup, period in ROLLUP_PERIODS.items():
+            if rollup in ENTITY_FILE_TIERS:
+                data = pa.concat_tables([parts[day] for day in days]).unify_dictionaries()
+                self._replace_entity_days(rollup, entity_id, days, rollup_table(data, period))
+            else:
+                for day in days:
+                    _write_parquet(rollup_table(parts[day], period), self._partition_path(rollup, entity_id, day))
+
+    def _replace_entity_days(self, rollup: str, entity_id: str, days: Iterable[int], buckets: pa.Table):
+        """Replace the buckets of the given days in a one-file-per-entity tier."""
+        path = self._rollup_path(rollup, entity_id)
+        if path.exists():
+            existing = pq.read_table(path, schema=ROLLUP_SCHEMA)
+            keep = ~np.isin(existing.column("timestamp").to_numpy() // 86400, np.fromiter(days, dtype=np.int64))
+            buckets = pa.concat_tables([existing.filter(pa.array(keep)), buckets]).unify_dictionaries()
+            buckets = buckets.take(pc.sort_indices(buckets, sort_keys=[("timestamp", "ascending")]))
+        if len(buckets):
+            _write_parquet(buckets, path)
+        elif path.exists():
+            shutil.rmtree(path.parent, ignore_errors=True)
+
+    def tier_days(self, tier: str, entity_id: str) -> set:
+        """UTC days (epoch days) a tier holds for one entity."""
+        if tier in ENTITY_FILE_TIERS:
+            path = self._rollup_path(tier, entity_id)
+            if not path.exists():
+                return set()
+            timestamps = pq.read_table(path, columns=["timestamp"]).column("timestamp").to_numpy()
+            return set((timestamps // 86400).tolist())
+        entity_path = self.table_path(tier) / f"entity_id={entity_id}"
+        return {_label_day(p.name.split("=", 1)[1]) for p in entity_path.glob("date=*") if p.is_dir()}
+
+    def _read_days(self, tier: str, entity_id: str, days: Iterable[int]) -> pa.Table:
+        """Rows of one entity for the given days, in time order."""
+        if tier in ENTITY_FILE_TIERS:
+            table = pq.read_table(self._rollup_path(tier, entity_id), schema=ROLLUP_SCHEMA)
+            mask = np.isin(table.column("timestamp").to_numpy() // 86400, np.fromiter(days, dtype=np.int64))
+            return table.filter(pa.array(mask))
+        schema = TABLE_SCHEMAS[tier]
+        parts = [
+            pq.read_table(self._partition_path(tier, entity_id, day), schema=schema)
+            for day in sorted(days)
+            if self._partition_path(tier, entity_id, day).exists()
+        ]
+        return pa.concat_tables(parts).unify_dictionaries() if parts else schema.empty_table()
+
+    def _drop_days(self, tier: str, entity_id: str, days: Iterable[int]):
+        if tier in ENTITY_FILE_TIERS:
+            self._replace_entity_days(tier, entity_id, days, ROLLUP_SCHEMA.empty_table())
+            return
+        for day in days:
+            shutil.rmtree(self._partition_path(tier, entity_id, day).parent, ignore_errors=True)
+
+    def _build_tier_days(self, tier: str, entity_id: str, days: Iterable[int], source: str):
+        """Fill a rollup tier for the given days from the next finer tier."""
+        data = self._read_days(source, entity_id, days)
+        buckets = rollup_table(data, ROLLUP_PERIODS[tier]) if source == "samples" else merge_buckets(
+            data, ROLLUP_PERIODS[tier]
+        )
+        if tier in ENTITY_FILE_TIERS:
+            self._replace_entity_days(tier, entity_id, days, buckets)
+            return
+        bucket_days = buckets.column("timestamp").to_numpy() // 86400
+        for day in np.unique(bucket_days):
+            _write_parquet(buckets.filter(pa.array(bucket_days == day)), self._partition_path(tier, entity_id, day))
+
+    def ensure_rollups(self, entity_ids: Optional[Iterable[str]] = None) -> int:
+        """Build the rollup buckets of sample days missing from any tier (stores written before the tiers existed)."""
+        built = 0
+        wanted = None if entity_ids is None else set(entity_ids)
+        for entity_id in self.entity_ids():
+            if wanted is not None and entity_id not in wanted:
+                continue
+            sample_days = self.tier_days("samples", entity_id)
+            missing = set()
+            for rollup in ROLLUP_PERIODS:
+                missing |= sample_days - self.tier_days(rollup, entity_id)
+            if missing:
+                self._update_rollups(
+                    entity_id,
+                    {day: self._read_days("samples", entity_id, [day]) for day in missing},
+                )
+                built += len(missing)
+        return built
+
+    def compact(self, retention: dict, now: Optional[float] = None) -> dict:
+        """
+        Apply per-tier retention (days to keep, 0 = forever) and return the days dropped per tier.
+
+        Before a tier drops a day, the next coarser tier is filled for that day if it has no
+        buckets there, so expiring data is always downsampled rather than lost.
+        """
+        today = int(time.time() if now is None else now) // 86400
+        dropped = {tier: 0 for tier in STORAGE_TIERS}
+        entity_ids = set()
+        for tier in STORAGE_TIERS:
+            entity_ids.update(self.entity_ids(tier))
+        for entity_id in sorted(entity_ids):
+            for index, tier in enumerate(STORAGE_TIERS):
+                keep_days = int(retention.get(tier, 0) or 0)
+                if keep_days <= 0:
+                    continue
+                expiring = {day for day in self.tier_days(tier, entity_id) if day < today - keep_days}
+                if not expiring:
+                    continue
+                if index + 1 < len(STORAGE_TIERS):
+                    coarser = STORAGE_TIERS[index + 1]
+                    missing = expiring - self.tier_days(coarser, entity_id)
+                    if missing:
+                        self._build_tier_days(coarser, entity_id, missing, tier)
+                self._drop_days(tier, entity_id, expiring)
+                dropped[tier] += len(expiring)
+        return dropped
+
+    def first_day(self, entity_ids: Optional[Iterable[str]] = None,
+                  tiers: Iterable[str] = STORAGE_TIERS) -> Optional[int]:
+        """Oldest UTC day held by any of the tiers (default: all)."""
+        wanted = None if entity_ids is None else set(entity_ids)
+        first = None
+        for tier in tiers:
+            for entity_id in self.entity_ids(tier):
+                if wanted is not None and entity_id not in wanted:
+                    continue
+                days = self.tier_days(tier, entity_id)
+                if days and (first is None or min(days) < first):
+                    first = min(days)
+        return first
+
+    def choose_tier(self, start, resolution: float = 0, retention: Optional[dict] = None,
+                    now: Optional[float] = None, entity_ids: Optional[Iterable[str]] = None) -> str:
+        """
+        Pick the tier to read [start, ...) from.
+
+        Raw samples are used unless retention has dropped them for part of the window while an
+        older rollup survives; then the coarsest rollup whose bucket is at most resolution
+        seconds and whose retention reaches back to start, or if none is fine enough, the
+        finest rollup that still reaches start.
+        """
+        retention = retention or {}
+        today = int(time.time() if now is None else now) // 86400
+        start = _epoch(start)
+        raw_first = self.first_day(entity_ids, ("samples",))
+        if raw_first is not None:
+            if start is not None and start // 86400 >= raw_first:
+                return "samples"
+            first = self.first_day(entity_ids, ROLLUP_PERIODS)
+            if first is None or first >= raw_first:
+                return "samples"
+
+        def reaches(tier: str) -> bool:
+            keep_days = int(retention.get(tier, 0) or 0)
+            return keep_days <= 0 or (start is not None and start // 86400 >= today - keep_days)
+
+        candidates = [tier for tier in ROLLUP_PERIODS if reaches(tier) and self.has_data(tier)]
+        fitting = [tier for tier in candidates if ROLLUP_PERIODS.get(tier, 0) <= resolution]
+        if fitting:
+            return fitting[-1]
+        return candidates[0] if candidates else "samples"
+
+    def _read_entity_files(self, rollup: str, entity_ids: Optional[Iterable[str]] = None,
+                           start=None, end=None) -> pa.Table:
+        """Read hourly or daily buckets (by bucket start) together with their entity_id."""
+        path = self.table_path(rollup)
+        if not path.exists():
+            return pa.unify_schemas([ROLLUP_PARTITION_SCHEMA, ROLLUP_SCHEMA]).empty_table()
+        dataset = ds.dataset(
+            path,
+            format="parquet",
+            schema=pa.unify_schemas([ROLLUP_SCHEMA, ROLLUP_PARTITION_SCHEMA]),
+            partitioning=ds.partitioning(ROLLUP_PARTITION_SCHEMA, flavor="hive"),
+            exclude_invalid_files=True,
+        )
+        expression = None
+        expressions = []
+        if entity_ids is not None:
+            expressions.append(ds.field("entity_id").isin(list(entity_ids)))
+        start, end = _epoch(start), _epoch(end)
+        if start is not None:
+            expressions.append(ds.field("timestamp") >= start)
+        if end is not None:
+            expressions.append(ds.field("timestamp") < end)
+        for other in expressions:
+            expression = other if expression is None else expression & other
+        result = dataset.to_table(columns=["entity_id"] + ROLLUP_SCHEMA.names, filter=expression)
+        index = result.column_names.index("entity_id")
+        result = result.set_column(index, "entity_id", pc.dictionary_encode(result.column("entity_id")))
+        return result.combine_chunks().unify_dictionaries()
+
+    def dataset(self, table: str = "samples") -> ds.Dataset:
+        schema = TABLE_SCHEMAS[table]
+        return ds.dataset(
+            self.table_path(table),
+            format="parquet",
+            schema=pa.unify_schemas([schema, PARTITION_SCHEMA]),
+            partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"),
+            exclude_invalid_files=True,
+        )
+
+    def read(self, table: str = "samples", entity_ids: Optional[Iterable[str]] = None,
+             columns: Optional[List[str]] = None, start=None, end=None) -> pa.Table:
+        """
+        Read a table together with its entity_id partition column.
+
+        Entity and [start, end) filters prune entity/date partitions first; inside the remaining
+        files the timestamp filter is checked against Parquet row-group statistics.
+        """
+        if table in ENTITY_FILE_TIERS:
+            result = self._read_entity_files(table, entity_ids, start, end)
+            return result if columns is None else result.select(columns)
+        if columns is None:
+            columns = ["entity_id"] + TABLE_SCHEMAS[table].names
+        expressions = []
+        if entity_ids is not None:
+            expressions.append(ds.field("entity_id").isin(list(entity_ids)))
+        start, end = _epoch(start), _epoch(end)
+        if start is not None:
+            expressions.append(ds.field("date") >= _day_label(start // 86400))
+            expressions.append(ds.field("timestamp") >= start)
+        if end is not None:
+            expressions.append(ds.field("date") <= _day_label((end - 1) // 86400))
+            expressions.append(ds.field("timestamp") < end)
+        expression = None
+        for other in expressions:
+            expression = other if expression is None else expression & other
+        result = self.dataset(table).to_table(columns=columns, filter=expression)
+        if "entity_id" in result.column_names:
+            index = result.column_names.index("entity_id")
+            result = result.set_column(index, "entity_id", pc.dictionary_encode(result.column("entity_id")))
+        return result.combine_chunks().unify_dictionaries()
+
+    def iter_rows(self, entity_id: str, table: str = "samples") -> Iterator[tuple]:
+        """Yield (timestamp, entity_id, friendly_name, value) rows of one entity in time order."""
+        path = self.table_path(table) / f"entity_id={entity_id}"
+        for file in sorted(path.glob("date=*/*.parquet")):
+            for batch in pq.ParquetFile(file).iter_batches(columns=["timestamp", "friendly_name", "value"]):
+                yield from zip(
+                    batch.column(0).to_pylist(),
+                    repeat(entity_id),
+                    batch.column(1).to_pylist(),
+                    batch.column(2).to_pylist(),
+                )
+
+    def clear(self, table: str = "samples"):
+        shutil.rmtree(self.table_path(table), ignore_errors=True)
+        if table == "samples":
+            for rollup in ROLLUP_PERIODS:
+                shutil.rmtree(self.table_path(rollup), ignore_errors=True)
+
+
+def sniff_csv(path: Path, encoding: str = "utf-8") -> tuple:
+    """Detect encoding and header from the first bytes of a CSV file (latin-1 fallback)."""
+    with open(path, "rb") as handle:
+        prefix = handle.read(CSV_SNIFF_BYTES)
+    try:
+        text = codecs.getincrementaldecoder(encoding)().decode(prefix, final=False)
+    except UnicodeDecodeError:
+        encoding = "latin-1"
+        text = prefix.decode(encoding)
+    header = next(csv.reader([text.lstrip("\ufeff").split("\n", 1)[0]]), [])
+    return encoding, [name.strip() for name in header]
+
+
+def read_report_csv(path: Path, encoding: str = "utf-8", columns: Optional[Iterable[str]] = None,
+                    entity_ids: Optional[Iterable[str]] = None, start=None, end=None,
+                    cache: Optional["LoadCache"] = None) -> tuple:
+    """
+    Read a CSV with the multithreaded Arrow parser, typed and pruned to the report columns.
+
+    The file is streamed in blocks and each block is filtered to the selected entities and
+    [start, end) window before it is kept, so deselected rows never accumulate in memory.
+    If a cache is given, every unfiltered block is also written to its sidecar.
+    Returns the table and the encoding that was used.
+    """
+    encoding, header = sniff_csv(path, encoding)
+    wanted = set(columns) if columns is not None else set(CSV_COLUMN_TYPES)
+    include = [name for name in header if name in wanted]
+    if not include:
+        raise ValueError(f"No known columns in {Path(path).name}")
+
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(
+            encoding="utf8" if codecs.lookup(encoding).name == "utf-8" else encoding,
+            use_threads=True,
+        ),
+        convert_options=pacsv.ConvertOptions(
+            column_types={name: CSV_COLUMN_TYPES[name] for name in include if name in CSV_COLUMN_TYPES},
+            include_columns=include,
+        ),
+    )
+    sidecar = cache.writer(path, reader.schema) if cache is not None else None
+    batches = []
+    try:
+        for batch in reader:
+            if sidecar is not None:
+                sidecar.write_batch(batch)
+            mask = row_mask(batch, entity_ids, start, end)
+            batches.append(batch if mask is None else batch.filter(mask))
+    except BaseException:
+        if sidecar is not None:
+            sidecar.abort()
+        raise
+    if sidecar is not None:
+        sidecar.commit()
+
+    table = pa.Table.from_batches(batches, schema=reader.schema)
+    return encode_categories(table), encoding
+
+
+def _content_hash(path: Path) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LoadCache:
+    """
+    Feather sidecars of parsed CSV tables, keyed by the fingerprint of their source file.
+
+    The fingerprint is (path, size, mtime, content hash). The hash is only recomputed when
+    size or mtime changed, so a touched but unchanged file is still a hit. Sidecars are
+    written uncompressed so hits are memory-mapped instead of parsed.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.index_path = self.cache_dir / "index.json"
+        self._index = None
+
+    @property
+    def index(self) -> dict:
+        if self._index is None:
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as handle:
+                    self._index = json.load(handle)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _sidecar_path(self, source: Path, content_hash: str) -> Path:
+        return self.cache_dir / f"{source.stem}-{content_hash}.feather"
+
+    def get(self, source: Path) -> Optional[pa.Table]:
+        entry = self.index.get(str(source))
+        if entry is None:
+            return None
+
+        stat = source.stat()
+        if (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            if entry["size"] != stat.st_size or _content_hash(source) != entry["hash"]:
+                return None
+            entry["mtime_ns"] = stat.st_mtime_ns
+            self._save_index()
+
+        sidecar = self._sidecar_path(source, entry["hash"])
+        if not sidecar.exists():
+            return None
+        return feather.read_table(sidecar, memory_map=True)
+
+    def writer(self, source: Path, schema: pa.Schema) -> "SidecarWriter":
+        return SidecarWriter(self, Path(source), schema)
+
+    def _commit(self, source: Path, tmp_path: Path):
+        stat = source.stat()
+        content_hash = _content_hash(source)
+
+        previous = self.index.get(str(source))
+        if previous is not None and previous["hash"] != content_hash:
+            self._sidecar_path(source, previous["hash"]).unlink(missing_ok=True)
+        os.replace(tmp_path, self._sidecar_path(source, content_hash))
+
+        self.index[str(source)] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "hash": content_hash,
+        }
+        self._save_index()
+
+    def _save_index(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(prefix="index.", suffix=".tmp", dir=self.cache_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            json.dump(self.index, handle)
+        os.replace(tmp_name, self.index_path)
+
+
+class SidecarWriter:
+    """Stream record batches into a cache sidecar; the entry is published on commit."""
+
+    def __init__(self, cache: LoadCache, source: Path, schema: pa.Schema):
+        self.cache = cache
+        self.source = source
+        cache.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Unique per writer: threads of one process may parse the same CSV at once
+        fd, tmp_name = tempfile.mkstemp(prefix=f"{source.stem}.", suffix=".tmp", dir=cache.cache_dir)
+        os.close(fd)
+        self.tmp_path = Path(tmp_name)
+        self._writer = pa.ipc.new_file(self.tmp_path, schema)
+
+    def write_batch(self, batch: pa.RecordBatch):
+        self._writer.write_batch(batch)
+
+    def commit(self):
+        self._writer.close()
+        self.cache._commit(self.source, self.tmp_path)
+
+    def abort(self):
+        self._writer.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class ReportCache:
+    """
+    Content-addressed cache of generated report files (analysis JSON, data CSV, charts).
+
+    Each entry is a directory named by a key hashed from everything the report depends on,
+    so a hit can be copied out as is. Hits refresh the entry's mtime and the least recently
+    used entries beyond max_entries are removed. An entry can also record the name of the
+    output last published from it (see published()).
+    """
+
+    def __init__(self, cache_dir, max_entries: int = REPORT_CACHE_ENTRIES):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+
+    def get(self, key: str) -> Optional[Dict[str, Path]]:
+        entry = self.cache_dir / key
+        try:
+            with open(entry / "manifest.json", "r", encoding="utf-8") as handle:
+                names = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        files = {name: entry / name for name in names}
+        if not all(path.exists() for path in files.values()):
+            return None
+        os.utime(entry)
+        return files
+
+    def put(self, key: str, files: Dict[str, Path]):
+        """Store copies of files under their given names."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path(tempfile.mkdtemp(prefix=f"{key}.", suffix=".tmp", dir=self.cache_dir))
+        for name, source in files.items():
+            shutil.copyfile(source, tmp_path / name)
+        with open(tmp_path / "manifest.json", "w", encoding="utf-8") as handle:
+            json.dump(sorted(files), handle)
+
+        entry = self.cache_dir / key
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp_path, entry)
+        self.prune()
+
+    def published(self, key: str) -> Optional[str]:
+        """Name of the output last published from an entry, if one was recorded."""
+        try:
+            return (self.cache_dir / key / REPORT_PUBLISHED_NAME).read_text(encoding="utf-8") or None
+        except OSError:
+            return None
+
+    def set_published(self, key: str, name: str):
+        entry = self.cache_dir / key
+        if entry.is_dir():
+            (entry / REPORT_PUBLISHED_NAME).write_text(name, encoding="utf-8")
+
+    def prune(self):
+        entries = sorted(
+            (path for path in self.cache_dir.iterdir() if path.is_dir() and not path.name.endswith(".tmp")),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True,
+        )
+        for stale in entries[self.max_entries:]:
+            shutil.rmtree(stale, ignore_errors=True)
@@ -0,0 +1,93 @@
+"""
+Warm pool of report worker processes.
+
+Starting a process, importing pandas, matplotlib and reportlab and building the font caches,
+PDF styles and chart templates takes seconds. A ReportWorkerPool pays for that once, in the
+background, and then runs the device report jobs of every generation on the same processes.
+
+This module only imports the report generator inside the workers, so creating a pool does
+not load the report stack into the calling process.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+# workers=0 uses one process per core, up to this many
+MAX_AUTO_WORKERS = 4
+
+
+def resolve_workers(workers: int) -> int:
+    """Number of processes for a worker setting (0 = one per core, up to MAX_AUTO_WORKERS)."""
+    if workers > 0:
+        return workers
+    return max(1, min(os.cpu_count() or 1, MAX_AUTO_WORKERS))
+
+
+def _initialize():
+    """Pool initializer: import the report stack and warm its caches."""
+    try:
+        from . import main
+    except ImportError:
+        import main
+    main.warm_up()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class ReportWorkerPool:
+    """
+    Long-lived spawn-context process pool whose workers start with the report stack warm.
+
+    submit() has the ProcessPoolExecutor signature, so the pool can be handed to
+    ShellyEnergyReport as its executor. A pool broken by a crashed worker is replaced
+    on the next submit.
+    """
+
+    def __init__(self, workers: int = 0):
+        self.workers = resolve_workers(workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _ensure(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_initialize,
+                )
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def start(self):
+        """Start every worker and block until all of them have warmed up."""
+        executor = self._ensure()
+        for future in [executor.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        executor = self._ensure()
+        try:
+            return executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            self._discard(executor)
+            return self._ensure().submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)